@@ -0,0 +1,152 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from category_samples import category_samples
+from intent_samples import intent_samples
+from model_config import DEFAULT_MODEL_NAME
+from onnx_encoder import default_onnx_dir
+from prepare_model import quantize_sentence_transformer
+from process_memory import read_rss_mb
+
+BACKENDS = ["torch", "torch-int8", "onnx", "onnx-int8"]
+
+
+def sample_questions(count: int, seed: int):
+    questions = [s for samples in (category_samples, intent_samples) for items in samples.values() for s in items]
+    random.Random(seed).shuffle(questions)
+    return questions[:count]
+
+
+def load_backend(backend: str, model_name: str, args):
+    if backend.startswith("onnx"):
+        from onnx_encoder import OnnxEncoder
+
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_cache")
+        return OnnxEncoder(
+            args.onnx_dir or default_onnx_dir(model_name, cache_dir),
+            quantized=backend == "onnx-int8",
+            intra_op_threads=args.threads,
+        )
+
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = SentenceTransformer(model_name, device="cpu")
+    if backend == "torch-int8":
+        # main.py 의 CPU 경로와 같은 동적 양자화
+        quantize_sentence_transformer(model)
+    return model
+
+
+def run_child(args):
+    """단일 백엔드 측정 - 프로세스를 분리해 RSS 가 서로 섞이지 않도록 함"""
+    questions = sample_questions(args.queries, args.seed)
+
+    started = time.perf_counter()
+    model = load_backend(args.backend, args.model, args)
+    load_seconds = time.perf_counter() - started
+    rss_loaded, _ = read_rss_mb()
+
+    try:
+        import torch
+        no_grad = torch.no_grad
+    except ImportError:
+        import contextlib
+        no_grad = contextlib.nullcontext
+
+    with no_grad():
+        for q in questions[:args.warmup]:
+            model.encode([q], show_progress_bar=False)
+
+        latencies = []
+        embeddings = []
+        for q in questions:
+            t0 = time.perf_counter()
+            embedding = model.encode([q], show_progress_bar=False)
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            embeddings.append(np.asarray(embedding, dtype=np.float32)[0])
+
+    rss_final, rss_peak = read_rss_mb()
+    np.save(args.embeddings_out, np.vstack(embeddings))
+    print(json.dumps({
+        "backend": args.backend,
+        "load_seconds": round(load_seconds, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "mean_ms": round(float(np.mean(latencies)), 2),
+        "rss_loaded_mb": round(rss_loaded, 1),
+        "rss_final_mb": round(rss_final, 1),
+        "rss_peak_mb": round(rss_peak, 1),
+    }))
+
+
+def main(args):
+    results = []
+    embeddings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends:
+            out = os.path.join(tmp, f"{backend}.npy")
+            cmd = [
+                sys.executable, os.path.abspath(__file__), "--child",
+                "--backend", backend, "--model", args.model,
+                "--queries", str(args.queries), "--warmup", str(args.warmup),
+                "--seed", str(args.seed), "--threads", str(args.threads),
+                "--embeddings-out", out,
+            ]
+            if args.onnx_dir:
+                cmd += ["--onnx-dir", args.onnx_dir]
+            print(f"[{backend}] 측정 중...")
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"[{backend}] 실패:\n{proc.stderr.strip()[-2000:]}")
+                continue
+            results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+            embeddings[backend] = np.load(out)
+
+    if not results:
+        print("측정된 백엔드가 없습니다.")
+        return
+
+    # 기준 백엔드(처음 성공한 것) 대비 임베딩 일치도 - 기존 인덱스와의 호환성 확인
+    reference = results[0]["backend"]
+    for row in results:
+        a, b = embeddings[reference], embeddings[row["backend"]]
+        cosine = np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+        row["min_cosine_vs_" + reference] = round(float(cosine.min()), 5)
+
+    print(f"\n쿼리 {args.queries}개 (배치 1) 기준 결과")
+    print(f"{'backend':<12}{'load(s)':>9}{'p50(ms)':>10}{'p99(ms)':>10}{'RSS(MB)':>10}{'peak(MB)':>10}{'min cos':>10}")
+    for row in results:
+        print(f"{row['backend']:<12}{row['load_seconds']:>9}{row['p50_ms']:>10}{row['p99_ms']:>10}"
+              f"{row['rss_loaded_mb']:>10}{row['rss_peak_mb']:>10}{row['min_cosine_vs_' + reference]:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="torch / ONNX Runtime 인코더 지연 시간 및 메모리 비교")
+    parser.add_argument("--model", type=str, default=DEFAULT_MODEL_NAME)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--onnx-dir", type=str, default=None, help="ONNX 모델 경로 (기본: model_cache/onnx/<모델 이름>)")
+    parser.add_argument("--queries", type=int, default=200, help="측정할 질문 수")
+    parser.add_argument("--warmup", type=int, default=10, help="측정 전 워밍업 질문 수")
+    parser.add_argument("--threads", type=int, default=0, help="추론 스레드 수 (0이면 라이브러리 기본값)")
+    parser.add_argument("--seed", type=int, default=42)
+    # 내부용 (백엔드별 자식 프로세스)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", type=str, choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--embeddings-out", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+    else:
+        main(args)
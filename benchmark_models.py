@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from category_samples import category_samples
+from index_builder import build_flat_index, collect_samples, split_holdout, top1_accuracy
+from intent_samples import intent_samples
+from model_config import DEFAULT_MODEL_NAME
+from prepare_model import quantize_sentence_transformer
+from process_memory import read_rss_mb
+
+# 현재 모델과 비교할 더 작은 다국어 인코더 후보
+DEFAULT_CANDIDATES = [
+    DEFAULT_MODEL_NAME,
+    "intfloat/multilingual-e5-base",
+    "intfloat/multilingual-e5-small",
+    "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+]
+
+DATASETS = {
+    "category": category_samples,
+    "intent": intent_samples,
+}
+
+
+def run_child(args):
+    """단일 모델 측정 - 모델마다 프로세스를 분리해 메모리 측정이 섞이지 않도록 함"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    started = time.perf_counter()
+    model = SentenceTransformer(args.model, device="cpu")
+    if args.quantize:
+        # main.py 의 CPU 경로와 같은 동적 양자화
+        quantize_sentence_transformer(model)
+    load_seconds = time.perf_counter() - started
+    rss_loaded, _ = read_rss_mb()
+
+    result = {
+        "model": args.model,
+        "dim": int(model.get_sentence_embedding_dimension()),
+        "load_seconds": round(load_seconds, 2),
+        "rss_loaded_mb": round(rss_loaded, 1),
+    }
+
+    latencies = []
+    with torch.no_grad():
+        for name, samples in DATASETS.items():
+            sentences, labels = collect_samples(samples)
+            train_idx, test_idx = split_holdout(labels, args.holdout_ratio, args.seed)
+            embeddings = np.asarray(model.encode(sentences, batch_size=64, show_progress_bar=False), dtype=np.float32)
+
+            labels = np.array(labels, dtype=object)
+            index = build_flat_index(np.ascontiguousarray(embeddings[train_idx]))
+            accuracy, _ = top1_accuracy(index, labels[train_idx], np.ascontiguousarray(embeddings[test_idx]),
+                                        labels[test_idx])
+            result[f"{name}_accuracy"] = round(accuracy, 4)
+            result[f"{name}_test"] = int(len(test_idx))
+
+            # 실제 서빙과 같은 배치 1 인코딩 지연 시간
+            for i in test_idx[:args.latency_queries]:
+                t0 = time.perf_counter()
+                model.encode([sentences[i]], show_progress_bar=False)
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+
+    _, rss_peak = read_rss_mb()
+    result.update({
+        "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 2),
+        "rss_peak_mb": round(rss_peak, 1),
+    })
+    print(json.dumps(result, ensure_ascii=False))
+
+
+def main(args):
+    results = []
+    for model_name in args.models:
+        cmd = [
+            sys.executable, os.path.abspath(__file__), "--child",
+            "--models", model_name,
+            "--holdout-ratio", str(args.holdout_ratio), "--seed", str(args.seed),
+            "--latency-queries", str(args.latency_queries), "--threads", str(args.threads),
+        ]
+        if not args.quantize:
+            cmd.append("--no-quantize")
+        print(f"[{model_name}] 측정 중...")
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"[{model_name}] 실패:\n{proc.stderr.strip()[-2000:]}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    if not results:
+        print("측정된 모델이 없습니다.")
+        return
+
+    print(f"\n홀드아웃 비율 {args.holdout_ratio} 기준 top-1 정확도 / 배치 1 인코딩 지연 시간 / 메모리")
+    print(f"{'model':<60}{'dim':>6}{'category':>10}{'intent':>9}{'p50(ms)':>9}{'p99(ms)':>9}{'RSS(MB)':>9}")
+    for row in results:
+        print(f"{row['model']:<60}{row['dim']:>6}{row['category_accuracy']:>10}{row['intent_accuracy']:>9}"
+              f"{row['p50_ms']:>9}{row['p99_ms']:>9}{row['rss_peak_mb']:>9}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"결과 저장: {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="임베딩 모델 후보별 분류 정확도 / 지연 시간 / 메모리 비교")
+    parser.add_argument("--models", nargs="+", default=DEFAULT_CANDIDATES, help="비교할 SentenceTransformer 모델 이름")
+    parser.add_argument("--holdout-ratio", type=float, default=0.2, help="평가용 홀드아웃 비율")
+    parser.add_argument("--latency-queries", type=int, default=100, help="데이터셋별 지연 시간 측정 질문 수")
+    parser.add_argument("--threads", type=int, default=0, help="torch 스레드 수 (0이면 기본값)")
+    parser.add_argument("--no-quantize", dest="quantize", action="store_false",
+                        help="CPU 동적 양자화 없이 측정 (기본은 서버와 같이 양자화)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=str, default=None, help="결과 JSON 저장 경로")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.model = args.models[0]
+        run_child(args)
+    else:
+        main(args)
@@ -0,0 +1,109 @@
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+DEFAULT_LENGTH_BUCKETS = (16, 32, 64, 128, 256, 512)
+
+
+class BucketedEncoder:
+    """
+    토큰 길이 기준으로 배치를 나눠 인코딩하는 래퍼
+
+    - 질문별 토큰화 결과를 LRU 캐시하여 반복 질문은 토크나이저를 건너뜀
+    - max_seq_length 로 잘라서 긴 입력(코드 붙여넣기 등)이 배치 전체를 느리게 만들지 않도록 함
+    - 길이 버킷(16/32/64/...)별로 나눠 짧은 질문이 긴 질문 길이만큼 패딩되지 않도록 함
+    """
+
+    def __init__(self, tokenizer, forward_fn, max_seq_length=128, buckets=DEFAULT_LENGTH_BUCKETS,
+                 token_cache_size=10000):
+        self.tokenizer = tokenizer
+        self.forward_fn = forward_fn
+        self.max_seq_length = int(max_seq_length)
+        self.buckets = sorted({int(b) for b in buckets if 0 < int(b) < self.max_seq_length} | {self.max_seq_length})
+        self.pad_token_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+        self.token_cache_size = max(0, int(token_cache_size))
+
+        self._token_cache = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.token_cache_hits = 0
+        self.token_cache_misses = 0
+        self.truncated = 0
+        self.bucket_counts = Counter()
+
+    def tokenize(self, text: str):
+        """토큰 id 목록 반환 (특수 토큰 포함, max_seq_length 로 잘림)"""
+        with self._lock:
+            ids = self._token_cache.get(text)
+            if ids is not None:
+                self._token_cache.move_to_end(text)
+                self.token_cache_hits += 1
+                return ids
+            self.token_cache_misses += 1
+
+        full = self.tokenizer(text, add_special_tokens=True, truncation=False)["input_ids"]
+        if len(full) > self.max_seq_length:
+            # 앞부분을 유지하고 마지막 토큰(</s>)은 보존하여 예측 가능하게 자름
+            ids = tuple(full[:self.max_seq_length - 1]) + (full[-1],)
+            truncated = True
+        else:
+            ids = tuple(full)
+            truncated = False
+
+        with self._lock:
+            if truncated:
+                self.truncated += 1
+            if self.token_cache_size:
+                self._token_cache[text] = ids
+                while len(self._token_cache) > self.token_cache_size:
+                    self._token_cache.popitem(last=False)
+        return ids
+
+    def bucket_of(self, length: int) -> int:
+        for bucket in self.buckets:
+            if length <= bucket:
+                return bucket
+        return self.max_seq_length
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        """길이 버킷별로 나눠 인코딩한 뒤 원래 순서로 합쳐서 반환"""
+        token_ids = [self.tokenize(text) for text in texts]
+
+        groups = {}
+        for i, ids in enumerate(token_ids):
+            groups.setdefault(self.bucket_of(len(ids)), []).append(i)
+
+        result = None
+        for bucket, positions in sorted(groups.items()):
+            # 버킷 경계가 아니라 그룹 내 실제 최대 길이까지만 패딩
+            length = max(len(token_ids[i]) for i in positions)
+            input_ids = np.full((len(positions), length), self.pad_token_id, dtype=np.int64)
+            attention_mask = np.zeros((len(positions), length), dtype=np.int64)
+            for row, i in enumerate(positions):
+                ids = token_ids[i]
+                input_ids[row, :len(ids)] = ids
+                attention_mask[row, :len(ids)] = 1
+
+            embeddings = np.asarray(self.forward_fn(input_ids, attention_mask), dtype=np.float32)
+            if result is None:
+                result = np.empty((len(texts), embeddings.shape[1]), dtype=np.float32)
+            result[positions] = embeddings
+            with self._lock:
+                self.bucket_counts[bucket] += len(positions)
+
+        if result is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.token_cache_hits + self.token_cache_misses
+            return {
+                "max_seq_length": self.max_seq_length,
+                "buckets": self.buckets,
+                "bucket_counts": {str(b): c for b, c in sorted(self.bucket_counts.items())},
+                "truncated": self.truncated,
+                "token_cache_entries": len(self._token_cache),
+                "token_cache_hit_rate": round(self.token_cache_hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,162 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """
+    동시 요청의 질문을 모아 한 번에 임베딩하는 마이크로 배치 스케줄러
+
+    - 배치가 max_batch_size 에 도달하거나, 첫 요청 이후 max_wait_ms 가 지나면 즉시 실행
+    - 각 호출자는 submit() 이 돌려준 Future 로 자신의 임베딩 결과를 받음
+    - stop() 후 큐에 남은 요청과 새 요청은 예외로 완료 (호출자가 결과를 무한정 기다리지 않도록)
+    """
+
+    def __init__(self, encode_fn, max_batch_size=16, max_wait_ms=5.0, name="embedding-batcher"):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._submit_lock = threading.Lock()  # 중지 표시와 큐 넣기 순서 보장
+
+        # 튜닝용 통계
+        self._batch_sizes = Counter()
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._encode_seconds = 0.0
+        self._wait_seconds = 0.0
+        self._max_queue_depth = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, wait=False):
+        with self._submit_lock:
+            self._stopped.set()
+            self._queue.put(None)
+        if self._thread is None or not self._thread.is_alive():
+            self._fail_pending()
+        elif wait:
+            self._thread.join(timeout=5.0)
+
+    def _fail_pending(self):
+        """큐에 남은 요청을 모두 예외로 완료"""
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError("임베딩 배치 스케줄러가 중지되었습니다"))
+
+    def submit(self, text: str) -> Future:
+        """질문 하나를 큐에 넣고 결과 Future 반환 (중지된 스케줄러면 예외로 완료된 Future)"""
+        future = Future()
+        with self._submit_lock:
+            if self._stopped.is_set():
+                future.set_exception(RuntimeError("임베딩 배치 스케줄러가 중지되었습니다"))
+                return future
+            self._queue.put((text, future, time.perf_counter()))
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+        return future
+
+    def encode(self, text: str, timeout=None) -> np.ndarray:
+        """동기 호출용 - 배치 처리가 끝날 때까지 대기 후 1차원 임베딩 반환 (timeout 초과 시 요청 취소 후 TimeoutError)"""
+        future = self.submit(text)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def _collect_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return []
+
+        batch = [item]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopped.set()
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            # 취소된 요청은 제외
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            texts = [text for text, _, _ in batch]
+            started = time.perf_counter()
+            try:
+                embeddings = np.asarray(self.encode_fn(texts), dtype=np.float32)
+            except Exception as e:
+                with self._lock:
+                    self._errors += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            elapsed = time.perf_counter() - started
+
+            with self._lock:
+                self._batches += 1
+                self._items += len(batch)
+                self._batch_sizes[len(batch)] += 1
+                self._encode_seconds += elapsed
+                self._wait_seconds += sum(started - enqueued for _, _, enqueued in batch)
+
+            for i, (_, future, _) in enumerate(batch):
+                future.set_result(embeddings[i])
+
+        # 중지 신호 뒤에 남은 요청 정리 (중지 후 submit 은 바로 예외로 완료되므로 더 들어오지 않음)
+        self._fail_pending()
+
+    def stats(self) -> dict:
+        """큐 깊이와 배치 크기 분포 등 튜닝용 통계"""
+        with self._lock:
+            batches = self._batches
+            items = self._items
+            return {
+                "running": self._thread is not None and self._thread.is_alive(),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": batches,
+                "items": items,
+                "errors": self._errors,
+                "avg_batch_size": round(items / batches, 2) if batches else 0.0,
+                "batch_size_histogram": {str(size): count for size, count in sorted(self._batch_sizes.items())},
+                "avg_encode_ms": round(self._encode_seconds * 1000.0 / batches, 2) if batches else 0.0,
+                "avg_queue_wait_ms": round(self._wait_seconds * 1000.0 / items, 2) if items else 0.0,
+            }
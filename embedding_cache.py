@@ -0,0 +1,343 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    캐시 키용 텍스트 정규화 - 유니코드 NFKC 정규화 후 연속 공백을 하나로 정리
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+class EmbeddingCache:
+    """
+    LRU + TTL 기반 임베딩 캐시
+
+    - 항목 수(max_entries)와 메모리(max_bytes) 한도를 모두 지키도록 오래된 항목부터 제거
+    - 벡터는 float16/float32 로 압축 저장하고, 꺼낼 때는 float32 로 반환
+    - 적중/미스/제거 횟수를 집계하여 stats() 로 제공
+    """
+
+    def __init__(self, max_entries=10000, max_bytes=64 * 1024 * 1024, ttl_seconds=3600.0, dtype="float16"):
+        self.max_entries = max(0, int(max_entries))
+        self.max_bytes = max(0, int(max_bytes))
+        self.ttl_seconds = float(ttl_seconds) if ttl_seconds else 0.0
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in (np.dtype(np.float16), np.dtype(np.float32)):
+            raise ValueError(f"지원하지 않는 캐시 dtype: {dtype}")
+
+        self._entries = OrderedDict()  # key -> (vector, expires_at, nbytes)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, text: str):
+        """캐시된 임베딩(float32) 반환, 없거나 만료되었으면 None"""
+        if not self.enabled:
+            return None
+        key = normalize_text(text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            vector, expires_at, _ = entry
+            if expires_at and expires_at < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return vector.astype(np.float32)
+
+    def put(self, text: str, vector):
+        if not self.enabled:
+            return
+        key = normalize_text(text)
+        stored = np.ascontiguousarray(np.asarray(vector).reshape(-1), dtype=self.dtype)
+        nbytes = stored.nbytes + len(key.encode("utf-8"))
+        if nbytes > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else 0.0
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (stored, expires_at, nbytes)
+            self._bytes += nbytes
+            # 한도를 넘으면 가장 오래 사용되지 않은 항목부터 제거
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, _, nbytes = self._entries.pop(key)
+        self._bytes -= nbytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "dtype": self.dtype.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class ResultCache:
+    """
+    정규화된 질문 → 분류 결과 LRU + TTL 캐시
+
+    - 항목마다 인덱스 버전을 함께 저장하고, 다른 버전으로 조회하면 미스로 처리
+    - 인덱스를 다시 읽으면 invalidate() 로 비움 (이전 버전으로 계산 중이던 결과가 나중에 들어와도 버전이 달라 무시됨)
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=3600.0):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_seconds = float(ttl_seconds) if ttl_seconds else 0.0
+
+        self._entries = OrderedDict()  # key -> (version, result, expires_at)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, key: str, version):
+        """같은 인덱스 버전으로 계산된 결과 반환, 없거나 만료되었으면 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version or (entry[2] and entry[2] < time.monotonic()):
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, key: str, version, result: dict):
+        if not self.enabled:
+            return
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else 0.0
+        with self._lock:
+            self._entries[key] = (version, dict(result), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self):
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class DiskEmbeddingCache:
+    """
+    SQLite 기반 2차 임베딩 캐시 - 여러 uvicorn 워커와 재시작 간에 공유
+
+    - 키는 (모델 이름, 정규화된 텍스트) 이므로 다른 모델의 벡터와 섞이지 않음
+    - WAL 모드로 열어 여러 프로세스가 동시에 읽을 수 있음
+    - 쓰기는 메모리에 모았다가 백그라운드 스레드가 한 트랜잭션으로 일괄 기록 (write-behind)
+    """
+
+    def __init__(self, path, model_name, dtype="float16", flush_interval=1.0, flush_batch_size=256):
+        self.path = path
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.flush_interval = max(0.05, float(flush_interval))
+        self.flush_batch_size = max(1, int(flush_batch_size))
+
+        self._local = threading.local()
+        self._pending = {}  # 정규화된 텍스트 -> 벡터 bytes
+        self._pending_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._stopped = threading.Event()
+        self._stats_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.flushes = 0
+        self.errors = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " dtype TEXT NOT NULL,"
+            " vector BLOB NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (model, text))"
+        )
+        conn.commit()
+
+        self._writer = threading.Thread(target=self._write_loop, name="embedding-disk-cache", daemon=True)
+        self._writer.start()
+
+    def _connection(self):
+        # sqlite3 연결은 스레드마다 따로 사용
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, text: str):
+        """디스크 캐시 조회 - 아직 기록되지 않은 대기 항목도 함께 확인"""
+        key = normalize_text(text)
+        with self._pending_lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            blob, dtype = pending, self.dtype
+        else:
+            try:
+                row = self._connection().execute(
+                    "SELECT vector, dtype FROM embeddings WHERE model = ? AND text = ?",
+                    (self.model_name, key),
+                ).fetchone()
+            except sqlite3.Error as e:
+                print(f"디스크 임베딩 캐시 조회 실패: {e}")
+                with self._stats_lock:
+                    self.errors += 1
+                return None
+            if row is None:
+                with self._stats_lock:
+                    self.misses += 1
+                return None
+            blob, dtype = row[0], np.dtype(row[1])
+
+        with self._stats_lock:
+            self.hits += 1
+        return np.frombuffer(blob, dtype=dtype).astype(np.float32)
+
+    def put(self, text: str, vector):
+        key = normalize_text(text)
+        blob = np.ascontiguousarray(np.asarray(vector).reshape(-1), dtype=self.dtype).tobytes()
+        with self._pending_lock:
+            self._pending[key] = blob
+            pending_count = len(self._pending)
+        if pending_count >= self.flush_batch_size:
+            self._flush_event.set()
+
+    def flush(self):
+        """대기 중인 항목을 한 트랜잭션으로 기록"""
+        with self._pending_lock:
+            if not self._pending:
+                return
+            items = list(self._pending.items())
+            self._pending = {}
+
+        now = time.time()
+        rows = [(self.model_name, key, self.dtype.name, blob, now) for key, blob in items]
+        try:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, text, dtype, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+            with self._stats_lock:
+                self.writes += len(rows)
+                self.flushes += 1
+        except sqlite3.Error as e:
+            print(f"디스크 임베딩 캐시 기록 실패: {e}")
+            with self._stats_lock:
+                self.errors += 1
+
+    def _write_loop(self):
+        while not self._stopped.is_set():
+            self._flush_event.wait(self.flush_interval)
+            self._flush_event.clear()
+            self.flush()
+
+    def close(self):
+        self._stopped.set()
+        self._flush_event.set()
+        self._writer.join(timeout=5.0)
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._pending_lock:
+            pending = len(self._pending)
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "model": self.model_name,
+                "dtype": self.dtype.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "pending_writes": pending,
+                "writes": self.writes,
+                "flushes": self.flushes,
+                "errors": self.errors,
+            }
@@ -0,0 +1,313 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import time
+
+# 프레임: 헤더(프로토콜 버전, op/상태, 요청 id, 본문 길이) + 본문
+PROTOCOL_VERSION = 2  # 2: 분류 결과에 인덱스 버전 포함, 인덱스 다시 읽기(OP_RELOAD)
+HEADER = struct.Struct("!BBII")
+
+OP_PING = 0
+OP_CLASSIFY = 1
+OP_RELOAD = 2
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+# 분류 결과 source 코드 (1바이트)
+SOURCES = [None, "exact", "ngram", "embedding"]
+
+DEFAULT_SOCKET_PATH = os.getenv("EMBEDDING_SERVICE_SOCKET", "") or "/tmp/cbcb-embedding.sock"
+
+
+def _pack_str(value) -> bytes:
+    data = (value or "").encode("utf-8")
+    return struct.pack("!H", len(data)) + data
+
+
+def _unpack_str(payload: bytes, offset: int):
+    (length,) = struct.unpack_from("!H", payload, offset)
+    offset += 2
+    return payload[offset:offset + length].decode("utf-8"), offset + length
+
+
+def pack_result(result: dict) -> bytes:
+    """
+    분류 결과를 바이너리로 직렬화
+    - source(1B) + 인덱스 버전 + [레이블, 신뢰도(f32), 차순위 수, (레이블, 점수)*] × (카테고리, 의도)
+    """
+    source = result.get("source")
+    parts = [
+        struct.pack("!B", SOURCES.index(source) if source in SOURCES else 0),
+        _pack_str(result.get("index_version")),
+    ]
+    for name in ("category", "intent"):
+        runner_up = result.get(f"{name}_runner_up") or []
+        parts.append(_pack_str(result.get(name)))
+        parts.append(struct.pack("!fB", float(result.get(f"{name}_confidence", 0.0)), len(runner_up)))
+        for item in runner_up:
+            parts.append(_pack_str(item["label"]))
+            parts.append(struct.pack("!f", float(item["score"])))
+    return b"".join(parts)
+
+
+def unpack_result(payload: bytes) -> dict:
+    result = {"source": SOURCES[payload[0]] if payload[0] < len(SOURCES) else None}
+    index_version, offset = _unpack_str(payload, 1)
+    result["index_version"] = index_version or None
+    for name in ("category", "intent"):
+        result[name], offset = _unpack_str(payload, offset)
+        confidence, count = struct.unpack_from("!fB", payload, offset)
+        offset += 5
+        runner_up = []
+        for _ in range(count):
+            label, offset = _unpack_str(payload, offset)
+            (score,) = struct.unpack_from("!f", payload, offset)
+            offset += 4
+            runner_up.append({"label": label, "score": round(score, 4)})
+        result[f"{name}_confidence"] = round(confidence, 4)
+        result[f"{name}_runner_up"] = runner_up
+    return result
+
+
+def _recv_exact(sock, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise ConnectionError("임베딩 서비스 연결이 끊어졌습니다")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def ping_service(path: str, timeout=1.0) -> dict:
+    """
+    임베딩 서비스 상태 조회 (동기, 로딩 스레드용) - 연결할 수 없으면 OSError
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(HEADER.pack(PROTOCOL_VERSION, OP_PING, 0, 0))
+        _, status, _, length = HEADER.unpack(_recv_exact(sock, HEADER.size))
+        payload = _recv_exact(sock, length)
+    if status != STATUS_OK:
+        raise RuntimeError(payload.decode("utf-8", "replace"))
+    return json.loads(payload)
+
+
+def wait_for_service(path: str, timeout=None, interval=0.5) -> dict:
+    """
+    임베딩 서비스가 뜨고 모델 로딩이 끝날 때까지 대기 (timeout 이 None 이나 0 이면 제한 없이 대기)
+    - 서비스가 모델 로딩 실패를 보고하면 RuntimeError
+    """
+    deadline = time.time() + timeout if timeout else None
+    last_error = None
+    last_report = time.time()
+    while deadline is None or time.time() < deadline:
+        try:
+            status = ping_service(path)
+            if status.get("state") == "ready":
+                return status
+            if status.get("state") == "failed":
+                raise RuntimeError(f"임베딩 서비스 모델 로딩 실패: {status.get('error')}")
+            last_error = f"state={status.get('state')}"
+        except (OSError, ConnectionError) as e:
+            last_error = str(e)
+        if time.time() - last_report >= 30:
+            print(f"임베딩 서비스 대기 중 ({path}): {last_error}")
+            last_report = time.time()
+        time.sleep(interval)
+    raise TimeoutError(f"임베딩 서비스 대기 시간 초과 ({path}): {last_error}")
+
+
+class EmbeddingServiceClient:
+    """
+    임베딩 서비스 비동기 클라이언트 - 연결 하나에 여러 요청을 요청 id 로 다중화
+
+    연결이 끊어지면 대기 중인 요청은 실패 처리하고, 다음 요청에서 다시 연결
+    """
+
+    def __init__(self, path: str, timeout=10.0):
+        self.path = path
+        self.timeout = float(timeout)
+        self._reader = None
+        self._writer = None
+        self._pending = {}  # 요청 id -> Future
+        self._next_id = 0
+        self._connect_lock = None
+        self._write_lock = None
+
+        self.requests = 0
+        self.errors = 0
+        self.connects = 0
+        self._latency_seconds = 0.0
+
+    async def _connect(self):
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+            self._write_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            self._reader, self._writer = await asyncio.open_unix_connection(self.path)
+            self.connects += 1
+            asyncio.get_running_loop().create_task(self._read_loop(self._reader, self._writer))
+
+    async def _read_loop(self, reader, writer):
+        error = ConnectionError("임베딩 서비스 연결이 끊어졌습니다")
+        try:
+            while True:
+                _, status, request_id, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+                payload = await reader.readexactly(length) if length else b""
+                future = self._pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if status == STATUS_OK:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(RuntimeError(payload.decode("utf-8", "replace")))
+        except (asyncio.IncompleteReadError, OSError) as e:
+            error = ConnectionError(f"임베딩 서비스 연결이 끊어졌습니다: {e}")
+        finally:
+            writer.close()
+            if self._writer is writer:
+                self._writer = None
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    async def request(self, op: int, payload=b"") -> bytes:
+        await self._connect()
+        self._next_id = (self._next_id + 1) % (1 << 32)
+        request_id = self._next_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        started = time.perf_counter()
+        self.requests += 1
+        try:
+            async with self._write_lock:
+                self._writer.write(HEADER.pack(PROTOCOL_VERSION, op, request_id, len(payload)) + payload)
+                await self._writer.drain()
+            return await asyncio.wait_for(future, self.timeout)
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self._pending.pop(request_id, None)
+            self._latency_seconds += time.perf_counter() - started
+
+    async def classify(self, question: str) -> dict:
+        return unpack_result(await self.request(OP_CLASSIFY, question.encode("utf-8")))
+
+    async def status(self) -> dict:
+        return json.loads(await self.request(OP_PING))
+
+    async def reload(self, force=False) -> dict:
+        return json.loads(await self.request(OP_RELOAD, b"\x01" if force else b""))
+
+    def stats(self) -> dict:
+        return {
+            "socket": self.path,
+            "connected": self._writer is not None and not self._writer.is_closing(),
+            "requests": self.requests,
+            "errors": self.errors,
+            "connects": self.connects,
+            "in_flight": len(self._pending),
+            "avg_latency_ms": round(self._latency_seconds * 1000.0 / self.requests, 3) if self.requests else 0.0,
+        }
+
+
+async def serve(path: str, classify_fn, status_fn, executor=None, reload_fn=None):
+    """
+    Unix 도메인 소켓 서버 - 요청마다 classify_fn 을 스레드 풀에서 실행
+    (모든 웹 워커의 요청이 한 프로세스의 배치 스케줄러로 모여 함께 인코딩됨)
+    """
+    loop = asyncio.get_running_loop()
+
+    async def respond(writer, write_lock, op, request_id, payload):
+        try:
+            if op == OP_CLASSIFY:
+                result = await loop.run_in_executor(executor, classify_fn, payload.decode("utf-8"))
+                body = pack_result(result)
+            elif op == OP_PING:
+                body = json.dumps(status_fn(), ensure_ascii=False, default=str).encode("utf-8")
+            elif op == OP_RELOAD and reload_fn is not None:
+                # 인덱스 읽기는 오래 걸릴 수 있으므로 분류 스레드 풀이 아닌 기본 풀에서 실행
+                result = await loop.run_in_executor(None, reload_fn, payload == b"\x01")
+                body = json.dumps(result, ensure_ascii=False, default=str).encode("utf-8")
+            else:
+                raise ValueError(f"알 수 없는 op: {op}")
+            status = STATUS_OK
+        except Exception as e:
+            status, body = STATUS_ERROR, str(e).encode("utf-8")
+        async with write_lock:
+            writer.write(HEADER.pack(PROTOCOL_VERSION, status, request_id, len(body)) + body)
+            await writer.drain()
+
+    async def handle(reader, writer):
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                version, op, request_id, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+                payload = await reader.readexactly(length) if length else b""
+                if version != PROTOCOL_VERSION:
+                    raise ConnectionError(f"지원하지 않는 프로토콜 버전: {version}")
+                # 같은 연결의 요청도 동시에 처리해야 배치로 묶임
+                task = loop.create_task(respond(writer, write_lock, op, request_id, payload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(handle, path=path)
+    os.chmod(path, 0o660)
+    print(f"임베딩 서비스 대기 중: {path}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="인코더 + FAISS 검색 전용 로컬 프로세스 (웹 워커들이 Unix 소켓으로 공유)")
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET_PATH, help="Unix 도메인 소켓 경로")
+    args = parser.parse_args()
+
+    # 서비스 프로세스 자신은 클라이언트 모드가 아니라 모델을 직접 로드
+    os.environ.pop("EMBEDDING_SERVICE_SOCKET", None)
+    import main
+    from process_memory import read_memory_mb
+
+    main.model_loader.start()
+    main.start_index_watcher()
+
+    def service_status():
+        return {
+            "state": main.model_loader.state,
+            "error": main.model_loader.error,
+            "pid": os.getpid(),
+            "index_version": main.label_indexes["version"],
+            "index_reload": main.index_reload_status,
+            "embedding_model": main.EMBEDDING_MODEL_NAME,
+            "embedding_backend": main.embedding_backend,
+            "batcher": main.embedding_batcher.stats() if main.embedding_batcher is not None else None,
+            "classify": main.classify_summary(),
+            "warmup": main.warmup_report,
+            "memory": read_memory_mb(),
+        }
+
+    try:
+        asyncio.run(serve(args.socket, main.predict_labels, service_status, main.classification_executor,
+                          main.reload_label_indexes))
+    except KeyboardInterrupt:
+        pass
@@ -1,6 +1,6 @@
-import pickle
 import faiss
 import numpy as np
+from index_builder import load_label_arrays
 from sklearn.manifold import TSNE
 import matplotlib.pyplot as plt
 from matplotlib import rc
@@ -16,12 +16,13 @@ plt.rcParams['axes.unicode_minus'] = False
 # 1. FAISS 인덱스 로드
 index = faiss.read_index("question_categories.index")
 
-# 2. pickle로 저장된 벡터 및 레이블 로드
-with open("question_categories.pkl", "rb") as f:
-    data = pickle.load(f)
+# 2. 저장된 벡터 및 레이블 로드 (레이블 테이블 + 레이블 id + 임베딩 .npy)
+label_names, label_ids, embeddings = load_label_arrays("question_categories", mmap=False)
+if embeddings is None:
+    raise SystemExit("임베딩 파일이 없습니다. --save-embeddings float16 옵션으로 인덱스를 다시 빌드하세요.")
 
-embeddings = data["embeddings"]
-labels = data["labels"]
+embeddings = np.asarray(embeddings, dtype=np.float32)
+labels = list(label_names[label_ids])
 
 # 3. 차원 축소 (t-SNE)
 tsne = TSNE(n_components=2, random_state=42, perplexity=30)
@@ -0,0 +1,35 @@
+"""
+멀티 워커 preload 실행 설정 - 마스터가 모델/인덱스를 한 번 로드한 뒤 워커를 fork
+
+    gunicorn -c gunicorn_conf.py main:app
+
+워커별 실제 추가 메모리(USS)는 `python process_memory.py <마스터 pid>` 로 확인
+"""
+import gc
+import os
+
+# main.py 가 import 시점에 모델을 로드하도록 설정 (preload_app 과 함께 사용)
+os.environ["PRELOAD_MODELS"] = "1"
+
+bind = os.getenv("BIND", "127.0.0.1:8000")
+workers = int(os.getenv("WORKERS", "2"))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+# 모델 로딩 시간을 고려한 타임아웃
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+
+# 워커별 torch 스레드 수 (기본: CPU 코어를 워커 수로 나눔)
+torch_threads = int(os.getenv("WORKER_TORCH_THREADS", str(max(1, (os.cpu_count() or 1) // max(1, workers)))))
+
+
+def when_ready(server):
+    # 로드가 끝난 객체를 GC 추적 대상에서 빼서 워커에서 GC 가 공유 페이지를 건드리지 않도록 함
+    gc.collect()
+    gc.freeze()
+    server.log.info("모델 preload 완료, 워커 fork 시작")
+
+
+def post_fork(server, worker):
+    import main
+
+    main.after_fork(torch_threads)
@@ -0,0 +1,69 @@
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_importtime(statement: str) -> str:
+    """
+    새 인터프리터에서 -X importtime 으로 statement 실행 후 stderr 반환 (모듈 캐시 영향 없음)
+    """
+    env = dict(os.environ, PRELOAD_MODELS="0")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=HERE, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import 실패:\n{proc.stderr.strip()[-2000:]}")
+    return proc.stderr
+
+
+def parse_importtime(output: str) -> dict:
+    """
+    importtime 출력 → 최상위 패키지별 자체 소요 시간(ms) 합계
+    (cumulative 는 중첩되므로 self 시간을 패키지 단위로 더함)
+    """
+    totals = defaultdict(float)
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, _, name = line[len("import time:"):].split("|", 2)
+            totals[name.strip().split(".")[0]] += int(self_us) / 1000.0
+        except ValueError:
+            continue
+    return dict(totals)
+
+
+def report(title: str, totals: dict, top: int) -> float:
+    total = sum(totals.values())
+    print(f"\n[{title}] 전체 {total:.1f}ms")
+    print(f"{'package':<32}{'ms':>10}{'share':>8}")
+    for name, ms in sorted(totals.items(), key=lambda item: -item[1])[:top]:
+        print(f"{name:<32}{ms:>10.1f}{ms / total * 100 if total else 0:>7.1f}%")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="main 모듈 import 시간 패키지별 분석 (python -X importtime)")
+    parser.add_argument("--top", type=int, default=15, help="출력할 패키지 수")
+    parser.add_argument("--budget-ms", type=float, default=0,
+                        help="main import 시간 상한(ms) - 초과하면 종료 코드 1 (0이면 검사하지 않음)")
+    parser.add_argument("--loader", action="store_true",
+                        help="모델 로딩 스레드에서 지연 import 하는 모듈(torch, sentence_transformers, faiss)도 측정")
+    args = parser.parse_args()
+
+    main_total = report("import main", parse_importtime(run_importtime("import main")), args.top)
+
+    if args.loader:
+        heavy = parse_importtime(run_importtime(
+            "import main, faiss, index_builder, torch, sentence_transformers"
+        ))
+        report("import main + 지연 import 모듈", heavy, args.top)
+
+    if args.budget_ms and main_total > args.budget_ms:
+        print(f"\nimport 시간 {main_total:.1f}ms 가 상한 {args.budget_ms:.1f}ms 를 넘었습니다")
+        sys.exit(1)
@@ -0,0 +1,747 @@
+import hashlib
+import json
+import math
+import os
+import pickle
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import faiss
+import numpy as np
+
+from embedding_cache import normalize_text
+from model_config import DEFAULT_MODEL_NAME
+from ngram_classifier import DEFAULT_MARGINS, DEFAULT_N_FEATURES, NgramClassifier, accepts, margin_sweep
+from prepare_model import file_sha256
+
+INDEX_TYPES = ["flat", "hnsw", "ivf"]
+COMPRESSIONS = ["none", "fp16", "sq8", "pq"]
+REFINES = ["auto", "none", "flat", "fp16", "sq8"]
+PQ_MIN_TRAIN_PER_CENTROID = 39  # faiss k-means 가 경고 없이 학습하는 중심점당 최소 학습 벡터 수
+TRANSFORMS = ["none", "pca", "opq"]
+
+
+def add_build_arguments(parser):
+    """카테고리/의도 인덱스 빌드 스크립트 공통 인자"""
+    parser.add_argument("--device", type=str, choices=["cpu", "cuda"], default="cpu", help="사용할 디바이스 선택")
+    parser.add_argument("--model", type=str, default=DEFAULT_MODEL_NAME,
+                        help="임베딩 모델 이름 (기본: EMBEDDING_MODEL_NAME 환경 변수, 서버와 같아야 함)")
+    parser.add_argument("--mode", type=str, choices=["knn", "prototype"], default="knn",
+                        help="knn: 모든 샘플 벡터 저장, prototype: 레이블별 대표 벡터(평균/k-means 중심)만 저장")
+    parser.add_argument("--prototypes-per-label", type=int, default=1,
+                        help="prototype 모드에서 레이블당 대표 벡터 수 (1이면 평균, 2 이상이면 k-means)")
+    parser.add_argument("--evaluate", action="store_true",
+                        help="홀드아웃 분할로 knn 대비 prototype 정확도 비교 리포트 출력")
+    parser.add_argument("--holdout-ratio", type=float, default=0.2, help="평가용 홀드아웃 비율")
+    parser.add_argument("--seed", type=int, default=42, help="분할/k-means 난수 시드")
+    parser.add_argument("--index-type", type=str, choices=INDEX_TYPES, default="flat",
+                        help="flat: 전수 검색, hnsw: 그래프 기반 ANN, ivf: 역색인 기반 ANN")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="HNSW 노드당 연결 수(M)")
+    parser.add_argument("--ef-construction", type=int, default=200, help="HNSW 빌드 시 탐색 폭(efConstruction)")
+    parser.add_argument("--ef-search", type=int, default=64, help="HNSW 기본 검색 폭(efSearch, 서버에서 FAISS_EF_SEARCH로 변경 가능)")
+    parser.add_argument("--ivf-nlist", type=int, default=0, help="IVF 클러스터 수 (0이면 벡터 수에 맞춰 자동 결정)")
+    parser.add_argument("--nprobe", type=int, default=8, help="IVF 기본 탐색 클러스터 수(nprobe, 서버에서 FAISS_NPROBE로 변경 가능)")
+    parser.add_argument("--compression", type=str, choices=COMPRESSIONS, default="none",
+                        help="벡터 저장 형식 - fp16/sq8: 스칼라 양자화, pq: 곱 양자화")
+    parser.add_argument("--pq-m", type=int, default=64, help="PQ 서브 양자화기 수 (차원의 약수여야 함)")
+    parser.add_argument("--pq-nbits", type=int, default=0,
+                        help="PQ 서브 양자화기당 비트 수 (0이면 자동: 학습 벡터가 39 x 2^nbits 개 이상인 최대값, 4~8) "
+                             "- 8비트는 학습 벡터 9,984개 이상 필요")
+    parser.add_argument("--refine", type=str, choices=REFINES, default="auto",
+                        help="후보 재정렬 단계 - flat: float32, fp16: float16, sq8: int8 벡터로 거리 재계산, "
+                             "auto: pq일 때만 sq8 (1024차원 기준 벡터당 약 1.1KB, float32 대비 약 1/4)")
+    parser.add_argument("--refine-k-factor", type=int, default=4, help="재정렬 시 k 대비 후보 배수(k_factor_rf)")
+    parser.add_argument("--transform", type=str, choices=TRANSFORMS, default="none",
+                        help="검색 전 차원 축소 변환 - pca: 주성분 분석, opq: PQ용 회전+축소 (인덱스에 함께 저장)")
+    parser.add_argument("--transform-dim", type=int, default=256, help="차원 축소 후 차원 수")
+    parser.add_argument("--save-embeddings", type=str, choices=["none", "float16", "float32"], default="float16",
+                        help="시각화/prototype 서빙/정확 일치 문장의 교차 분류용 임베딩 .npy 저장 형식")
+    parser.add_argument("--ngram-features", type=int, default=DEFAULT_N_FEATURES,
+                        help="1차 분류기(문자 n-gram) 해시 특징 수 (0이면 생성하지 않음)")
+    parser.add_argument("--cascade-min-score", type=float, default=float(os.getenv("CASCADE_MIN_SCORE", "0.3")),
+                        help="--evaluate cascade 리포트에 적용할 1차 분류기 최고 점수 하한 (서버 CASCADE_MIN_SCORE 와 같게)")
+    return parser
+
+
+def collect_samples(samples: dict):
+    """{레이블: [문장, ...]} 형태의 샘플을 문장/레이블 목록으로 평탄화"""
+    sentences = []
+    labels = []
+    for label, items in samples.items():
+        for s in items:
+            sentences.append(s)
+            labels.append(label)
+    return sentences, labels
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def compute_prototypes(embeddings, labels, per_label=1, seed=42):
+    """
+    레이블별 샘플 벡터를 대표 벡터로 축약
+
+    - per_label == 1 또는 샘플 수가 적으면 평균 벡터 사용
+    - per_label >= 2 이면 레이블 내부에서 k-means 중심 사용
+    - e5 임베딩은 정규화되어 있으므로 대표 벡터도 단위 길이로 맞춤
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    labels = list(labels)
+    label_order = list(dict.fromkeys(labels))
+    label_array = np.array(labels, dtype=object)
+
+    proto_vectors = []
+    proto_labels = []
+    for label in label_order:
+        vectors = embeddings[label_array == label]
+        k = min(max(1, int(per_label)), len(vectors))
+        if k == 1:
+            centroids = vectors.mean(axis=0, keepdims=True)
+        else:
+            kmeans = faiss.Kmeans(vectors.shape[1], k, niter=20, seed=seed, verbose=False, min_points_per_centroid=1)
+            kmeans.train(np.ascontiguousarray(vectors))
+            centroids = kmeans.centroids
+        proto_vectors.append(normalize_rows(centroids))
+        proto_labels.extend([label] * len(centroids))
+
+    return np.ascontiguousarray(np.vstack(proto_vectors), dtype=np.float32), proto_labels
+
+
+def build_flat_index(vectors, device_choice="cpu"):
+    if device_choice == "cuda":
+        # GPU용 FAISS 설정
+        res = faiss.StandardGpuResources()
+        index_flat = faiss.IndexFlatL2(vectors.shape[1])
+        index = faiss.index_cpu_to_gpu(res, 0, index_flat)
+    else:
+        # CPU용 FAISS 설정
+        index = faiss.IndexFlatL2(vectors.shape[1])
+    index.add(vectors)
+    return faiss.index_gpu_to_cpu(index) if device_choice == "cuda" else index
+
+
+def auto_nlist(n_vectors: int) -> int:
+    """IVF 클러스터 수 - 일반적인 4*sqrt(N) 기준, 클러스터당 학습 벡터 39개 이상 유지"""
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def resolve_refine(args) -> str:
+    refine = getattr(args, "refine", "none")
+    if refine == "auto":
+        return "sq8" if getattr(args, "compression", "none") == "pq" else "none"
+    return refine
+
+
+def resolve_pq_nbits(args, n_train: int) -> int:
+    """
+    PQ 코드 비트 수 - 서브 양자화기마다 2^nbits 개 중심점을 k-means 로 학습하므로
+    자동(0)이면 중심점당 학습 벡터가 PQ_MIN_TRAIN_PER_CENTROID 개 이상인 최대 비트 수 (4~8)
+    """
+    nbits = getattr(args, "pq_nbits", 0)
+    if nbits:
+        return nbits
+    return max(4, min(8, int(math.log2(max(n_train, 1) / PQ_MIN_TRAIN_PER_CENTROID))))
+
+
+def index_factory_string(index_type: str, n_vectors: int, args) -> str:
+    """빌드 옵션을 faiss.index_factory 문자열로 변환"""
+    codec = {
+        "none": "Flat",
+        "fp16": "SQfp16",
+        "sq8": "SQ8",
+        "pq": f"PQ{getattr(args, 'pq_m', 64)}x{resolve_pq_nbits(args, n_vectors)}",
+    }[getattr(args, "compression", "none")]
+
+    if index_type == "hnsw":
+        factory = f"HNSW{args.hnsw_m}" if codec == "Flat" else f"HNSW{args.hnsw_m},{codec}"
+    elif index_type == "ivf":
+        nlist = args.ivf_nlist or auto_nlist(n_vectors)
+        factory = f"IVF{min(nlist, n_vectors)},{codec}"
+    else:
+        factory = codec
+
+    # 차원 축소 변환 - IndexPreTransform 으로 저장되어 검색 시 쿼리에 자동 적용
+    transform = getattr(args, "transform", "none")
+    if transform == "pca":
+        factory = f"PCA{args.transform_dim},{factory}"
+    elif transform == "opq":
+        factory = f"OPQ{getattr(args, 'pq_m', 64)}_{args.transform_dim},{factory}"
+
+    # 압축된 코드로 후보를 찾은 뒤 더 정밀한 벡터로 거리를 다시 계산
+    # (Refine 은 변환 전 원본 차원 벡터로 재계산)
+    refine = resolve_refine(args)
+    if refine == "flat":
+        factory += ",RFlat"
+    elif refine == "fp16":
+        factory += ",Refine(SQfp16)"
+    elif refine == "sq8":
+        factory += ",Refine(SQ8)"
+    return factory
+
+
+def search_params(index_type: str, args) -> dict:
+    """인덱스 종류별 검색 시 파라미터 (메타데이터에 기록되어 서버에서 복원)"""
+    params = {}
+    if index_type == "hnsw":
+        params["efSearch"] = args.ef_search
+    elif index_type == "ivf":
+        params["nprobe"] = args.nprobe
+    if resolve_refine(args) != "none":
+        params["k_factor_rf"] = args.refine_k_factor
+    return params
+
+
+def apply_search_params(index, params: dict):
+    """
+    efSearch / nprobe 등 검색 파라미터 적용 - PreTransform/Refine 래퍼 내부까지 적용됨
+    """
+    space = faiss.ParameterSpace()
+    for name, value in (params or {}).items():
+        if value is None:
+            continue
+        try:
+            space.set_index_parameter(index, name, value)
+        except Exception as e:
+            print(f"검색 파라미터 적용 실패 ({name}={value}): {e}")
+
+
+def _hnsw_of(index):
+    """래퍼 인덱스 안쪽의 HNSW 구조 탐색"""
+    index = faiss.downcast_index(index)
+    if hasattr(index, "hnsw"):
+        return index.hnsw
+    for attr in ("index", "base_index"):
+        inner = getattr(index, attr, None)
+        if inner is not None:
+            return _hnsw_of(inner)
+    return None
+
+
+def build_index(vectors, index_type="flat", args=None, device_choice="cpu"):
+    """
+    인덱스 종류에 맞춰 faiss 인덱스 생성/학습/추가 (CPU 인덱스 반환)
+    """
+    factory = index_factory_string(index_type, len(vectors), args) if args is not None else "Flat"
+    if factory == "Flat":
+        return build_flat_index(vectors, device_choice)
+
+    index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_L2)
+
+    hnsw = _hnsw_of(index)
+    if hnsw is not None:
+        hnsw.efConstruction = args.ef_construction
+
+    # HNSW, 재정렬(Refine), 차원 축소(PreTransform) 인덱스는 CPU에서 빌드
+    use_gpu = device_choice == "cuda" and hnsw is None \
+        and not isinstance(index, (faiss.IndexRefine, faiss.IndexPreTransform))
+    if use_gpu:
+        res = faiss.StandardGpuResources()
+        index = faiss.index_cpu_to_gpu(res, 0, index)
+
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+
+    if use_gpu:
+        index = faiss.index_gpu_to_cpu(index)
+    apply_search_params(index, search_params(index_type, args))
+    return index
+
+
+@contextmanager
+def atomic_path(path: str):
+    """
+    임시 경로에 쓴 뒤 rename 으로 교체 - 실행 중인 서버가 mmap 으로 열어 둔 이전 파일(inode)은 그대로 유지되고,
+    인덱스를 다시 읽는 쪽은 반쯤 쓰인 파일을 보지 않음 (확장자는 유지하여 np.save 가 이름을 바꾸지 않도록)
+    """
+    root, ext = os.path.splitext(path)
+    tmp = f"{root}.tmp{os.getpid()}{ext}"
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def meta_path(prefix: str) -> str:
+    return f"{prefix}.meta.json"
+
+
+def write_index_meta(prefix: str, meta: dict):
+    with atomic_path(meta_path(prefix)) as tmp, open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def read_index_meta(prefix: str) -> dict:
+    """빌드 시 기록된 인덱스 메타데이터 - 없으면(이전 빌드) flat 인덱스로 간주"""
+    path = meta_path(prefix)
+    if not os.path.exists(path):
+        return {"index_type": "flat", "search_params": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def label_table_path(prefix: str) -> str:
+    return f"{prefix}.labels.json"
+
+
+def label_ids_path(prefix: str) -> str:
+    return f"{prefix}.label_ids.npy"
+
+
+def embeddings_path(prefix: str) -> str:
+    return f"{prefix}.embeddings.npy"
+
+
+def build_label_table(labels):
+    """
+    샘플별 레이블 목록을 (레이블 이름 배열, 샘플별 레이블 id 배열)로 변환
+    """
+    names = list(dict.fromkeys(labels))
+    positions = {name: i for i, name in enumerate(names)}
+    ids = np.fromiter((positions[label] for label in labels), dtype=np.int32, count=len(labels))
+    return np.array(names, dtype=object), ids
+
+
+def save_label_arrays(prefix: str, labels, embeddings, embeddings_dtype="float16"):
+    """
+    인덱스 행 순서에 맞춘 레이블 저장
+
+    - {prefix}.labels.json    : 레이블 이름 테이블 (레이블 수만큼만 저장)
+    - {prefix}.label_ids.npy  : 인덱스 행별 레이블 id (int16/int32, mmap 가능)
+    - {prefix}.embeddings.npy : 선택 - 시각화/prototype 서빙용 임베딩 (기본 float16)
+    """
+    names, ids = build_label_table(labels)
+    with atomic_path(label_table_path(prefix)) as tmp, open(tmp, "w", encoding="utf-8") as f:
+        json.dump([str(name) for name in names], f, ensure_ascii=False)
+    id_dtype = np.int16 if len(names) <= np.iinfo(np.int16).max else np.int32
+    with atomic_path(label_ids_path(prefix)) as tmp:
+        np.save(tmp, ids.astype(id_dtype))
+
+    if embeddings_dtype and embeddings_dtype != "none":
+        with atomic_path(embeddings_path(prefix)) as tmp:
+            np.save(tmp, np.ascontiguousarray(embeddings, dtype=embeddings_dtype))
+    elif os.path.exists(embeddings_path(prefix)):
+        # 이전 빌드의 임베딩이 남아 인덱스와 어긋나지 않도록 제거
+        os.remove(embeddings_path(prefix))
+
+
+def load_label_arrays(prefix: str, mmap=True):
+    """
+    (레이블 이름 배열, 인덱스 행별 레이블 id, 임베딩 또는 None) 로드
+
+    - 레이블 id/임베딩 .npy 는 읽기 전용 mmap 으로 열고, 언피클 없이 바로 사용
+    - 새 형식이 없으면 이전 형식 {prefix}.pkl 로 대체
+    """
+    mmap_mode = "r" if mmap else None
+    if os.path.exists(label_table_path(prefix)) and os.path.exists(label_ids_path(prefix)):
+        with open(label_table_path(prefix), "r", encoding="utf-8") as f:
+            names = np.array(json.load(f), dtype=object)
+        ids = np.load(label_ids_path(prefix), mmap_mode=mmap_mode)
+        embeddings = None
+        if os.path.exists(embeddings_path(prefix)):
+            embeddings = np.load(embeddings_path(prefix), mmap_mode=mmap_mode)
+        return names, ids, embeddings
+
+    with open(f"{prefix}.pkl", "rb") as f:
+        data = pickle.load(f)
+    names, ids = build_label_table(data["labels"])
+    return names, ids, data.get("embeddings")
+
+
+def exact_table_path(prefix: str) -> str:
+    return f"{prefix}.exact.json"
+
+
+def build_exact_table(sentences, labels, with_rows=True) -> dict:
+    """
+    정규화된 샘플 문장 → [레이블, {prefix}.embeddings.npy 행 번호] 해시 테이블 (서로 다른 레이블에 속한 문장은 제외)
+
+    행 번호는 서버가 인코딩 없이 다른 레이블 인덱스(카테고리 ↔ 의도)를 검색할 때 사용하며,
+    샘플별 임베딩이 저장되지 않는 빌드(prototype 모드 등)에서는 None
+    """
+    table = {}
+    ambiguous = set()
+    for row, (sentence, label) in enumerate(zip(sentences, labels)):
+        key = normalize_text(sentence)
+        if key in table and table[key][0] != label:
+            ambiguous.add(key)
+        table[key] = [label, row if with_rows else None]
+    for key in ambiguous:
+        del table[key]
+    return table
+
+
+def save_exact_table(prefix: str, sentences, labels, with_rows=True):
+    table = build_exact_table(sentences, labels, with_rows)
+    with atomic_path(exact_table_path(prefix)) as tmp, open(tmp, "w", encoding="utf-8") as f:
+        json.dump(table, f, ensure_ascii=False)
+    return table
+
+
+def load_exact_table(prefix: str) -> dict:
+    """정규화된 문장 → (레이블, 임베딩 행 번호 또는 None) - 행 번호가 없는 이전 형식도 읽음"""
+    path = exact_table_path(prefix)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        table = json.load(f)
+    return {key: (value, None) if isinstance(value, str) else (value[0], value[1]) for key, value in table.items()}
+
+
+def load_sample_embeddings(prefix: str):
+    """exact 테이블 행 번호로 조회할 샘플 임베딩 (읽기 전용 mmap), 없으면 None"""
+    if not os.path.exists(embeddings_path(prefix)):
+        return None
+    return np.load(embeddings_path(prefix), mmap_mode="r")
+
+
+def ngram_path(prefix: str) -> str:
+    return f"{prefix}.ngram.npz"
+
+
+def load_ngram_classifier(prefix: str):
+    path = ngram_path(prefix)
+    if not os.path.exists(path):
+        return None
+    return NgramClassifier.load(path)
+
+
+def has_label_arrays(prefix: str) -> bool:
+    return os.path.exists(label_ids_path(prefix)) or os.path.exists(f"{prefix}.pkl")
+
+
+def read_index(prefix: str, mmap=True):
+    """
+    {prefix}.index 로드 - mmap 이면 벡터 코드를 힙에 복사하지 않고 페이지 캐시를 워커 간 공유
+    """
+    flags = 0
+    if mmap:
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    return faiss.read_index(f"{prefix}.index", flags)
+
+
+def artifact_paths(prefix: str):
+    """메타데이터에 크기/수정 시각을 기록하는 빌드 결과물 (메타데이터 자신과 이전 형식 .pkl 제외)"""
+    return [f"{prefix}.index", label_table_path(prefix), label_ids_path(prefix), embeddings_path(prefix),
+            exact_table_path(prefix), ngram_path(prefix)]
+
+
+_digest_cache = {}  # (경로, inode, 크기, 수정 시각) → sha256 - 같은 파일을 한 프로세스에서 여러 번 해시하지 않도록
+
+
+def artifact_digest(path: str) -> str:
+    """파일 내용 sha256 (복사/다운로드로 수정 시각이 바뀌어도 내용이 같으면 같은 값)"""
+    stat = os.stat(path)
+    key = (path, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    digest = _digest_cache.get(key)
+    if digest is None:
+        digest = _digest_cache[key] = file_sha256(path)
+    return digest
+
+
+def artifact_stamps(prefix: str) -> dict:
+    """파일 이름 → {size, sha256} - 빌드 마지막에 메타데이터에 기록"""
+    return {
+        os.path.basename(path): {"size": os.path.getsize(path), "sha256": artifact_digest(path)}
+        for path in artifact_paths(prefix) if os.path.exists(path)
+    }
+
+
+def stale_artifacts(prefix: str, meta: dict) -> list:
+    """
+    메타데이터에 기록된 크기/내용 해시와 다른 파일 목록 - 빌드 도중(메타데이터를 쓰기 전)이거나
+    다른 빌드의 파일이 섞인 경우 (기록이 없는 이전 빌드는 검사하지 않음)
+    """
+    recorded = meta.get("artifacts")
+    if recorded is None:
+        return []
+    stale = []
+    for path in artifact_paths(prefix):
+        name = os.path.basename(path)
+        expected = recorded.get(name)
+        if expected is None or not os.path.exists(path):
+            if expected is not None or os.path.exists(path):
+                stale.append(name)
+        elif os.path.getsize(path) != expected.get("size") or artifact_digest(path) != expected.get("sha256"):
+            stale.append(name)
+    return stale
+
+
+def artifact_version(prefixes, extra=()) -> str:
+    """
+    인덱스/레이블/1차 분류기 파일의 크기와 수정 시각으로 만든 버전 문자열 (파일이 바뀌면 달라짐)
+    """
+    digest = hashlib.sha1()
+    for prefix in prefixes:
+        for path in (f"{prefix}.index", label_table_path(prefix), label_ids_path(prefix), f"{prefix}.pkl",
+                     meta_path(prefix), exact_table_path(prefix), ngram_path(prefix)):
+            if os.path.exists(path):
+                stat = os.stat(path)
+                digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns};".encode("utf-8"))
+    for value in extra:
+        digest.update(f"{value};".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def split_holdout(labels, holdout_ratio=0.2, seed=42):
+    """
+    레이블별 층화 분할 - 샘플이 2개 이상인 레이블은 최소 1개를 평가용으로 분리
+    """
+    rng = np.random.default_rng(seed)
+    label_array = np.array(labels, dtype=object)
+    train_idx = []
+    test_idx = []
+    for label in dict.fromkeys(labels):
+        idx = np.flatnonzero(label_array == label)
+        rng.shuffle(idx)
+        n_test = int(round(len(idx) * holdout_ratio))
+        if len(idx) >= 2:
+            n_test = min(max(1, n_test), len(idx) - 1)
+        else:
+            n_test = 0
+        test_idx.extend(idx[:n_test])
+        train_idx.extend(idx[n_test:])
+    return np.sort(np.array(train_idx, dtype=np.int64)), np.sort(np.array(test_idx, dtype=np.int64))
+
+
+def top1_accuracy(index, index_labels, queries, expected):
+    started = time.perf_counter()
+    _, I = index.search(queries, 1)
+    elapsed = time.perf_counter() - started
+    predicted = np.array(index_labels, dtype=object)[I[:, 0]]
+    accuracy = float(np.mean(predicted == np.array(expected, dtype=object))) if len(expected) else 0.0
+    return accuracy, elapsed * 1000.0 / max(1, len(queries))
+
+
+def evaluate_prototypes(embeddings, labels, per_label=1, holdout_ratio=0.2, seed=42):
+    """
+    홀드아웃 분할에서 전체 kNN(top-1)과 prototype 인덱스의 정확도/크기 비교
+    """
+    train_idx, test_idx = split_holdout(labels, holdout_ratio, seed)
+    if len(test_idx) == 0:
+        print("평가용 샘플이 없어 평가를 건너뜁니다.")
+        return None
+
+    labels = np.array(labels, dtype=object)
+    train_vectors = np.ascontiguousarray(embeddings[train_idx])
+    test_vectors = np.ascontiguousarray(embeddings[test_idx])
+
+    knn_index = build_flat_index(train_vectors)
+    knn_acc, knn_ms = top1_accuracy(knn_index, labels[train_idx], test_vectors, labels[test_idx])
+
+    proto_vectors, proto_labels = compute_prototypes(train_vectors, labels[train_idx], per_label, seed)
+    proto_index = build_flat_index(proto_vectors)
+    proto_acc, proto_ms = top1_accuracy(proto_index, proto_labels, test_vectors, labels[test_idx])
+
+    report = {
+        "train": len(train_idx),
+        "test": len(test_idx),
+        "knn": {"vectors": knn_index.ntotal, "accuracy": knn_acc, "ms_per_query": knn_ms},
+        "prototype": {"vectors": proto_index.ntotal, "accuracy": proto_acc, "ms_per_query": proto_ms},
+    }
+
+    print(f"[평가] 학습 {report['train']}개 / 평가 {report['test']}개 (레이블당 대표 벡터 {per_label}개)")
+    print(f"  knn       : 벡터 {knn_index.ntotal:>6}개, 정확도 {knn_acc:.4f}, 쿼리당 {knn_ms:.3f}ms")
+    print(f"  prototype : 벡터 {proto_index.ntotal:>6}개, 정확도 {proto_acc:.4f}, 쿼리당 {proto_ms:.3f}ms")
+    print(f"  정확도 차이: {proto_acc - knn_acc:+.4f}, 벡터 수 {knn_index.ntotal / max(1, proto_index.ntotal):.1f}배 감소")
+    return report
+
+
+def report_cascade(embeddings, sentences, labels, args, holdout_ratio=0.2, seed=42):
+    """
+    홀드아웃에서 1차 분류기 margin 임계값별 처리 비율/정확도와 e5(flat top-1)로 넘긴 경우의 전체 정확도 리포트
+    """
+    train_idx, test_idx = split_holdout(labels, holdout_ratio, seed)
+    if len(test_idx) == 0:
+        print("평가용 샘플이 없어 cascade 리포트를 건너뜁니다.")
+        return None
+
+    labels = np.array(labels, dtype=object)
+    expected = labels[test_idx]
+    model = NgramClassifier(args.ngram_features).fit([sentences[i] for i in train_idx], list(labels[train_idx]))
+
+    started = time.perf_counter()
+    rows, predictions = margin_sweep(model, [sentences[i] for i in test_idx], list(expected), DEFAULT_MARGINS,
+                                     args.cascade_min_score)
+    ngram_ms = (time.perf_counter() - started) * 1000.0 / len(test_idx)
+
+    index = build_flat_index(np.ascontiguousarray(embeddings[train_idx]))
+    _, I = index.search(np.ascontiguousarray(embeddings[test_idx]), 1)
+    e5_predicted = labels[train_idx][I[:, 0]]
+    e5_acc = float(np.mean(e5_predicted == expected))
+
+    print(f"[cascade] 1차 분류기 쿼리당 {ngram_ms:.3f}ms, 크기 {model.nbytes() / 1024:.1f}KB, e5 단독 정확도 {e5_acc:.4f} "
+          f"(최고 점수 >= {args.cascade_min_score})")
+    for row in rows:
+        combined = [
+            p["label"] if accepts(p, row["margin"], args.cascade_min_score) else e5
+            for p, e5 in zip(predictions, e5_predicted)
+        ]
+        row["combined_accuracy"] = float(np.mean(np.array(combined, dtype=object) == expected))
+        print(f"  margin >= {row['margin']:<5}: 1차 처리 {row['coverage']:.1%}, 1차 정확도 {row['accuracy']:.4f}, "
+              f"전체 정확도 {row['combined_accuracy']:.4f} (e5 호출 {1 - row['coverage']:.1%})")
+    return {"e5_accuracy": e5_acc, "ngram_ms_per_query": ngram_ms, "min_score": args.cascade_min_score, "margins": rows}
+
+
+def report_ann_recall(embeddings, labels, args, holdout_ratio=0.2, seed=42):
+    """
+    홀드아웃 쿼리로 flat 기준 대비 ANN 인덱스의 recall@1 / 정확도 / 지연 시간 리포트
+    """
+    train_idx, test_idx = split_holdout(labels, holdout_ratio, seed)
+    if len(test_idx) == 0:
+        print("평가용 샘플이 없어 ANN 리포트를 건너뜁니다.")
+        return None
+
+    labels = np.array(labels, dtype=object)
+    train_vectors = np.ascontiguousarray(embeddings[train_idx])
+    test_vectors = np.ascontiguousarray(embeddings[test_idx])
+    expected = labels[test_idx]
+
+    flat = build_flat_index(train_vectors)
+    started = time.perf_counter()
+    _, flat_ids = flat.search(test_vectors, 1)
+    flat_ms = (time.perf_counter() - started) * 1000.0 / len(test_idx)
+    flat_acc = float(np.mean(labels[train_idx][flat_ids[:, 0]] == expected))
+
+    ann = build_index(train_vectors, args.index_type, args)
+    if args.index_type == "hnsw":
+        name, values = "efSearch", sorted({16, 32, 64, 128, args.ef_search})
+    else:
+        nlist = faiss.extract_index_ivf(ann).nlist
+        name, values = "nprobe", sorted({v for v in (1, 4, 8, 16, 32, args.nprobe) if v <= nlist})
+
+    print(f"[ANN 리포트] {args.index_type} vs flat (학습 {len(train_idx)}개 / 쿼리 {len(test_idx)}개)")
+    print(f"  flat            : 정확도 {flat_acc:.4f}, 쿼리당 {flat_ms:.3f}ms")
+    rows = []
+    for value in values:
+        apply_search_params(ann, {name: value})
+        started = time.perf_counter()
+        _, ann_ids = ann.search(test_vectors, 1)
+        ann_ms = (time.perf_counter() - started) * 1000.0 / len(test_idx)
+        recall = float(np.mean(ann_ids[:, 0] == flat_ids[:, 0]))
+        valid = ann_ids[:, 0] >= 0
+        acc = float(np.mean(valid & (labels[train_idx][np.where(valid, ann_ids[:, 0], 0)] == expected)))
+        rows.append({name: value, "recall_at_1": recall, "accuracy": acc, "ms_per_query": ann_ms})
+        print(f"  {name}={value:<6}: recall@1 {recall:.4f}, 정확도 {acc:.4f}, 쿼리당 {ann_ms:.3f}ms")
+    return rows
+
+
+def index_nbytes(index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def report_vs_flat(embeddings, labels, args, holdout_ratio=0.2, seed=42):
+    """
+    홀드아웃 쿼리로 원본 flat 인덱스 대비 압축/차원 축소 인덱스의 top-1 일치율, 정확도, 크기 리포트
+    """
+    train_idx, test_idx = split_holdout(labels, holdout_ratio, seed)
+    if len(test_idx) == 0:
+        print("평가용 샘플이 없어 flat 대비 리포트를 건너뜁니다.")
+        return None
+
+    labels = np.array(labels, dtype=object)
+    train_labels = labels[train_idx]
+    train_vectors = np.ascontiguousarray(embeddings[train_idx])
+    test_vectors = np.ascontiguousarray(embeddings[test_idx])
+
+    flat = build_flat_index(train_vectors)
+    _, flat_ids = flat.search(test_vectors, 1)
+
+    compressed = build_index(train_vectors, args.index_type, args)
+    _, ids = compressed.search(test_vectors, 1)
+    valid = ids[:, 0] >= 0
+    id_agreement = float(np.mean(ids[:, 0] == flat_ids[:, 0]))
+    predicted = train_labels[np.where(valid, ids[:, 0], 0)]
+    label_agreement = float(np.mean(valid & (predicted == train_labels[flat_ids[:, 0]])))
+    flat_accuracy = float(np.mean(train_labels[flat_ids[:, 0]] == labels[test_idx]))
+    accuracy = float(np.mean(valid & (predicted == labels[test_idx])))
+
+    flat_bytes = index_nbytes(flat)
+    compressed_bytes = index_nbytes(compressed)
+    report = {
+        "factory": index_factory_string(args.index_type, len(train_idx), args),
+        "top1_id_agreement": id_agreement,
+        "top1_label_agreement": label_agreement,
+        "flat_accuracy": flat_accuracy,
+        "accuracy": accuracy,
+        "flat_bytes": flat_bytes,
+        "compressed_bytes": compressed_bytes,
+    }
+    print(f"[flat 대비 리포트] {report['factory']} vs Flat (학습 {len(train_idx)}개 / 쿼리 {len(test_idx)}개)")
+    print(f"  top-1 일치율: 벡터 {id_agreement:.4f}, 레이블 {label_agreement:.4f}")
+    print(f"  정확도: {flat_accuracy:.4f} → {accuracy:.4f} ({accuracy - flat_accuracy:+.4f})")
+    print(f"  인덱스 크기: {flat_bytes / 1024:.1f}KB → {compressed_bytes / 1024:.1f}KB "
+          f"({flat_bytes / max(1, compressed_bytes):.1f}배 감소)")
+    return report
+
+
+def build_label_index(samples: dict, output_prefix: str, args):
+    """
+    샘플을 임베딩하여 {output_prefix}.index 와 레이블/메타데이터 파일 생성
+    """
+    from sentence_transformers import SentenceTransformer
+
+    model_name = args.model
+    model = SentenceTransformer(model_name, device=args.device)
+
+    sentences, labels = collect_samples(samples)
+    embeddings = np.asarray(model.encode(sentences), dtype=np.float32)
+
+    if args.evaluate:
+        evaluate_prototypes(embeddings, labels, args.prototypes_per_label, args.holdout_ratio, args.seed)
+    if args.index_type != "flat":
+        report_ann_recall(embeddings, labels, args, args.holdout_ratio, args.seed)
+    if args.compression != "none" or args.transform != "none":
+        report_vs_flat(embeddings, labels, args, args.holdout_ratio, args.seed)
+    if args.evaluate and args.ngram_features:
+        report_cascade(embeddings, sentences, labels, args, args.holdout_ratio, args.seed)
+
+    if args.mode == "prototype":
+        vectors, index_labels = compute_prototypes(embeddings, labels, args.prototypes_per_label, args.seed)
+        print(f"prototype 인덱스: 샘플 {len(labels)}개 → 대표 벡터 {len(index_labels)}개")
+    else:
+        vectors, index_labels = embeddings, labels
+
+    index = build_index(vectors, args.index_type, args, args.device)
+
+    # 파일은 모두 임시 파일 → rename 으로 교체하고 메타데이터를 마지막에 써서, 실행 중인 서버의 인덱스 감시가
+    # 새 버전을 읽기 시작할 때 이전 파일과 섞이지 않도록 함 (main.py INDEX_WATCH_SECONDS)
+    with atomic_path(f"{output_prefix}.index") as tmp:
+        faiss.write_index(index, tmp)
+    save_label_arrays(output_prefix, index_labels, vectors, args.save_embeddings)
+    # knn 모드에서만 embeddings.npy 행이 샘플 순서와 같음
+    exact_table = save_exact_table(output_prefix, sentences, labels,
+                                   with_rows=args.mode == "knn" and args.save_embeddings != "none")
+    print(f"정확 일치 테이블 저장 완료 (문장 {len(exact_table)}개)")
+    if args.ngram_features:
+        ngram = NgramClassifier(args.ngram_features).fit(sentences, labels)
+        with atomic_path(ngram_path(output_prefix)) as tmp:
+            ngram.save(tmp)
+        print(f"1차 분류기 저장 완료 ({ngram_path(output_prefix)}, {ngram.nbytes() / 1024:.1f}KB)")
+    elif os.path.exists(ngram_path(output_prefix)):
+        # 이전 빌드의 1차 분류기가 남아 새 레이블 테이블에 없는 레이블을 반환하지 않도록 제거
+        os.remove(ngram_path(output_prefix))
+    write_index_meta(output_prefix, {
+        "index_type": args.index_type,
+        "factory": index_factory_string(args.index_type, len(vectors), args),
+        "search_params": search_params(args.index_type, args),
+        "compression": args.compression,
+        "refine": resolve_refine(args),
+        "transform": args.transform,
+        "transform_dim": args.transform_dim if args.transform != "none" else None,
+        "mode": args.mode,
+        "model_name": model_name,
+        "dim": int(vectors.shape[1]),
+        "ntotal": int(index.ntotal),
+        "labels": len(set(index_labels)),
+        # 메타데이터는 마지막에 쓰므로, 서버는 이 기록과 다른 파일이 있으면 빌드 중인 것으로 보고 사용하지 않음
+        "artifacts": artifact_stamps(output_prefix),
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    print(f"{output_prefix}.index 저장 완료 (벡터 {index.ntotal}개, 모드: {args.mode}, 인덱스: {args.index_type}, "
+          f"압축: {args.compression}, 크기: {index_nbytes(index) / 1024:.1f}KB)")
@@ -1,3 +1,6 @@
+import time
+_main_import_started = time.perf_counter()
+
 from fastapi import FastAPI, Form, Query, Request, Body
 from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
@@ -5,220 +8,1074 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from sse_starlette.sse import EventSourceResponse
 import httpx
+import asyncio
 import uuid
+import random
 import json
 from pathlib import Path
 import os
-import time
+import hmac
+import importlib
+import sys
 import threading
-import pickle
-import faiss
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from fastapi import FastAPI
-from fastapi.responses import JSONResponse
-from sentence_transformers import SentenceTransformer
-import torch
+from embedding_batcher import EmbeddingBatcher
+from model_loader import ModelLoader
+from ngram_classifier import accepts
+from model_config import DEFAULT_MODEL_NAME, DEFAULT_MODEL_REVISION
+from prepare_model import default_prepared_dir, load_prepared_model, quantize_sentence_transformer
+from process_memory import read_memory_mb
+from bucketed_encoder import BucketedEncoder
+from embedding_service import EmbeddingServiceClient, wait_for_service
+from embedding_cache import EmbeddingCache, DiskEmbeddingCache, ResultCache, normalize_text
+
+# torch / sentence_transformers / faiss(index_builder) 는 import 에 수 초가 걸리므로 로더 스레드에서 처음 필요할 때 import
+# (UI, 정적 파일, /api/status 는 모듈 import 직후 바로 응답 가능)
+torch = None
+SentenceTransformer = None
+use_gpu = False
+device = "cpu"
+import_seconds = {}  # 지연 import 한 모듈별 소요 시간(초)
 
 # 글로벌 변수
 embedding_model = None
-category_index = None
-intent_index = None
-category_labels = []
-intent_labels = []
-models_ready = False
-loading_thread = None
+# 분류 종류 → (인덱스 파일 접두사, 표시 이름)
+LABEL_INDEX_FILES = {
+    "category": ("question_categories", "카테고리"),
+    "intent": ("intent_categories", "의도"),
+}
+
+
+def empty_label_index() -> dict:
+    return {
+        "index": None,
+        "labels": np.array([], dtype=object),  # 레이블 이름 테이블
+        "label_ids": np.array([], dtype=np.int32),  # 인덱스 행별 레이블 id
+        "meta": {},
+        "exact": {},  # 정규화된 샘플 문장 → (레이블, 샘플 임베딩 행 번호)
+        "ngram": None,  # 문자 n-gram 1차 분류기
+    }
+
+
+# 카테고리/의도 인덱스 묶음과 버전 (인덱스 파일 버전 - 결과 캐시 무효화와 결과 태그에 사용)
+# 다시 읽을 때는 새 dict 를 만들어 이 참조 하나만 교체하므로, 진행 중인 요청은 시작할 때 잡은 묶음을 끝까지 사용
+# "exact": 정규화된 샘플 문장 → 카테고리/의도 결과 통합 테이블 (build_joint_exact_table)
+label_indexes = {"version": None, "exact": {}, **{name: empty_label_index() for name in LABEL_INDEX_FILES}}
+embedding_batcher = None
+bucketed_encoder = None
 model_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_cache")
+# 임베딩 모델 - 빌드 스크립트와 같은 EMBEDDING_MODEL_NAME 환경 변수 사용
+EMBEDDING_MODEL_NAME = DEFAULT_MODEL_NAME
+EMBEDDING_MODEL_REVISION = DEFAULT_MODEL_REVISION
+
+# 임베딩 추론 백엔드 (torch: SentenceTransformer, onnx: onnxruntime - onnx_encoder.py 로 미리 변환 필요)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "")
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "1") == "1"
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+ONNX_INTER_OP_THREADS = int(os.getenv("ONNX_INTER_OP_THREADS", "0"))
+embedding_backend = None  # 실제 로드된 백엔드
+embedding_precision = None  # 실제 로드된 가중치 형식 (int8/fp16/fp32) - 디스크 캐시 키에 사용
+
+# prepare_model.py 로 미리 만든 모델 (CPU: int8 양자화 모듈, GPU: fp16 safetensors) - 없으면 원본 모델 로드 후 양자화
+USE_PREPARED_MODEL = os.getenv("USE_PREPARED_MODEL", "1") == "1"
+PREPARED_MODEL_DIR = os.getenv("PREPARED_MODEL_DIR", "")
+PREPARED_MODEL_VERIFY = os.getenv("PREPARED_MODEL_VERIFY", "1") == "1"
+prepared_model_info = None  # 로드된 준비 모델 manifest
+
+# 레이블 인덱스 서빙 모드 (knn: 모든 샘플 검색, prototype: 레이블별 대표 벡터만 검색)
+LABEL_INDEX_MODE = os.getenv("LABEL_INDEX_MODE", "knn")
+LABEL_PROTOTYPES_PER_LABEL = int(os.getenv("LABEL_PROTOTYPES_PER_LABEL", "1"))
+
+# ANN 인덱스 검색 파라미터 (미설정 시 인덱스 빌드 시 기록된 값 사용)
+FAISS_EF_SEARCH = os.getenv("FAISS_EF_SEARCH")
+FAISS_NPROBE = os.getenv("FAISS_NPROBE")
+FAISS_REFINE_K_FACTOR = os.getenv("FAISS_REFINE_K_FACTOR")
+
+# 인덱스/레이블 파일을 읽기 전용 mmap 으로 열어 여러 워커가 페이지 캐시를 공유
+INDEX_MMAP = os.getenv("INDEX_MMAP", "1") == "1"
+
+# top-k 거리 가중 투표 설정
+CLASSIFY_TOP_K = max(1, int(os.getenv("CLASSIFY_TOP_K", "10")))
+CLASSIFY_VOTE_TEMPERATURE = float(os.getenv("CLASSIFY_VOTE_TEMPERATURE", "0.05"))
+CLASSIFY_RUNNER_UPS = int(os.getenv("CLASSIFY_RUNNER_UPS", "2"))
+# 이 신뢰도보다 낮으면 채팅에서 해당 분류를 시스템 프롬프트에 사용하지 않음
+CLASSIFY_MIN_CONFIDENCE = float(os.getenv("CLASSIFY_MIN_CONFIDENCE", "0.3"))
+
+# 1차 분류기(문자 n-gram) cascade - 1, 2위 점수 차가 임계값 이상일 때만 바로 응답하고 나머지는 e5 로 넘김
+CASCADE_ENABLED = os.getenv("CASCADE_ENABLED", "0") == "1"
+CASCADE_MIN_MARGIN = float(os.getenv("CASCADE_MIN_MARGIN", "0.2"))
+CASCADE_MIN_MARGINS = {
+    "category": float(os.getenv("CASCADE_CATEGORY_MIN_MARGIN", str(CASCADE_MIN_MARGIN))),
+    "intent": float(os.getenv("CASCADE_INTENT_MIN_MARGIN", str(CASCADE_MIN_MARGIN))),
+}
+CASCADE_MIN_SCORE = float(os.getenv("CASCADE_MIN_SCORE", "0.3"))
+
+# 질문 인코딩 시 최대 토큰 수와 길이 버킷 (짧은 질문이 긴 질문 길이만큼 패딩되지 않도록 분리)
+EMBED_MAX_SEQ_LENGTH = int(os.getenv("EMBED_MAX_SEQ_LENGTH", "128"))
+EMBED_LENGTH_BUCKETS = [int(v) for v in os.getenv("EMBED_LENGTH_BUCKETS", "16,32,64,128").split(",") if v.strip()]
+EMBED_TOKEN_CACHE_SIZE = int(os.getenv("EMBED_TOKEN_CACHE_SIZE", "10000"))
+
+# 임베딩 마이크로 배치 설정 (최대 배치 크기 / 첫 요청 이후 최대 대기 시간)
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "16"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "5"))
+# 분류 스레드가 배치 인코딩 결과를 기다리는 최대 시간(초) - 넘으면 요청을 취소하고 "알 수 없음" 응답
+EMBED_TIMEOUT_SECONDS = float(os.getenv("EMBED_TIMEOUT_SECONDS", "30"))
+
+# 분류 전용 스레드 풀 - 인코딩/검색이 이벤트 루프(SSE 스트리밍)를 막지 않도록 분리
+# 작업자는 대부분 배치 결과를 기다리므로 배치 크기만큼은 동시에 대기할 수 있게 설정
+CLASSIFY_WORKERS = int(os.getenv("CLASSIFY_WORKERS", str(max(4, EMBED_BATCH_MAX_SIZE))))
+classification_executor = ThreadPoolExecutor(max_workers=CLASSIFY_WORKERS, thread_name_prefix="classify")
+
+# 임베딩 캐시 (LRU + TTL, 항목 수/메모리 한도)
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "10000")),
+    max_bytes=int(float(os.getenv("EMBED_CACHE_MAX_MB", "64")) * 1024 * 1024),
+    ttl_seconds=float(os.getenv("EMBED_CACHE_TTL_SECONDS", "3600")),
+    dtype=os.getenv("EMBED_CACHE_DTYPE", "float16"),
+)
+
+# 임베딩 서비스 모드 - 설정하면 이 프로세스는 모델을 로드하지 않고 embedding_service.py 프로세스에 분류를 요청
+EMBEDDING_SERVICE_SOCKET = os.getenv("EMBEDDING_SERVICE_SOCKET", "")
+EMBEDDING_SERVICE_TIMEOUT = float(os.getenv("EMBEDDING_SERVICE_TIMEOUT", "10"))
+# 0이면 서비스가 준비될 때까지 제한 없이 기다림 (시간 제한으로 실패하면 다음 분류 요청에서 다시 대기)
+EMBEDDING_SERVICE_WAIT = float(os.getenv("EMBEDDING_SERVICE_WAIT", "0"))
+embedding_service_client = (
+    EmbeddingServiceClient(EMBEDDING_SERVICE_SOCKET, timeout=EMBEDDING_SERVICE_TIMEOUT)
+    if EMBEDDING_SERVICE_SOCKET else None
+)
+
+# 멀티 워커 preload 모드 (gunicorn_conf.py) - 마스터 프로세스가 import 시 모델/인덱스를 한 번 로드하고
+# fork 된 워커들이 가중치와 인덱스 페이지를 copy-on-write 로 공유
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "0") == "1"
+if PRELOAD_MODELS and EMBEDDING_BACKEND == "onnx":
+    # ONNX Runtime 세션은 fork 후 안전하게 사용할 수 없으므로 워커가 각자 로드 (startup 이벤트)
+    print("ONNX 백엔드는 fork 전 preload 를 지원하지 않아 워커별로 모델을 로드합니다 (PRELOAD_MODELS 무시)")
+    PRELOAD_MODELS = False
+
+# 디스크 임베딩 캐시 (선택) - 워커 간/재시작 후에도 공유되는 2차 캐시
+EMBED_DISK_CACHE_PATH = os.getenv("EMBED_DISK_CACHE_PATH", "")
+
+def embedding_cache_model_key() -> str:
+    """
+    디스크 캐시의 모델 키 - 모델/리비전, 백엔드와 가중치 형식, 최대 토큰 수가 모두 같을 때만 저장된 임베딩 재사용
+    (예: intfloat/multilingual-e5-large-instruct|torch-int8|seq128)
+    """
+    name = f"{EMBEDDING_MODEL_NAME}@{EMBEDDING_MODEL_REVISION}" if EMBEDDING_MODEL_REVISION else EMBEDDING_MODEL_NAME
+    engine = "onnx" if embedding_backend.startswith("onnx") else "torch"
+    return f"{name}|{engine}-{embedding_precision}|seq{embedding_model.max_seq_length}"
+
 
-# GPU 사용 가능 여부 확인
-use_gpu = torch.cuda.is_available()
-device = torch.device("cuda" if use_gpu else "cpu")
+def open_disk_embedding_cache():
+    """모델 로드 후 (인코더 단계 다음) 호출 - 캐시 키가 로드된 모델 설정에 따라 정해짐"""
+    if not EMBED_DISK_CACHE_PATH:
+        return None
+    try:
+        cache = DiskEmbeddingCache(
+            EMBED_DISK_CACHE_PATH,
+            embedding_cache_model_key(),
+            dtype=os.getenv("EMBED_CACHE_DTYPE", "float16"),
+            flush_interval=float(os.getenv("EMBED_DISK_CACHE_FLUSH_SECONDS", "1")),
+        )
+        print(f"디스크 임베딩 캐시 사용: {EMBED_DISK_CACHE_PATH} ({cache.model_name})")
+        return cache
+    except Exception as e:
+        print(f"디스크 임베딩 캐시 초기화 실패 (무시됨): {e}")
+        return None
+
+# 모델 로딩 스레드의 인코더 단계 후에 연다 - SQLite 연결과 기록 스레드는 fork 로 복사하면 안 되므로
+# preload 모드에서는 워커에서 연다 (after_fork)
+disk_embedding_cache = None
+
+# 시작 시 워밍업 - 준비 완료 전에 샘플 질문을 여러 배치 크기로 인코딩/검색하여 초기 지연을 없애고 지연 시간 측정
+WARMUP_QUESTIONS = int(os.getenv("WARMUP_QUESTIONS", "32"))  # 0이면 워밍업 생략
+WARMUP_BATCH_SIZES = [int(v) for v in os.getenv("WARMUP_BATCH_SIZES", "1,4,16").split(",") if v.strip()]
+warmup_report = None  # 워밍업 후 측정한 인코딩/검색 p50/p99
+
+# 분류 결과 캐시 - 자주 나오는 질문은 인코딩/검색 없이 dict 조회 한 번으로 응답
+result_cache = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "10000")),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL_SECONDS", "3600")),
+)
+
+# 분류 경로별 통계
+classify_stats = {
+    "requests": 0, "exact_hits": 0, "ngram_hits": 0, "encoded": 0,
+    "category_ngram": 0, "category_escalated": 0, "intent_ngram": 0, "intent_escalated": 0,
+}
+classify_stats_lock = threading.Lock()
+
+def count_classify(name: str):
+    with classify_stats_lock:
+        classify_stats[name] += 1
+
+def classify_summary() -> dict:
+    """분류 경로별 처리 건수와 e5 로 넘어간 비율"""
+    with classify_stats_lock:
+        summary = dict(classify_stats)
+    requests = summary["requests"]
+    summary["escalation_rate"] = round(summary["encoded"] / requests, 4) if requests else 0.0
+    for name in ("category", "intent"):
+        decided = summary[f"{name}_ngram"] + summary[f"{name}_escalated"]
+        summary[f"{name}_escalation_rate"] = round(summary[f"{name}_escalated"] / decided, 4) if decided else 0.0
+    indexes = label_indexes
+    summary["exact_table_size"] = len(indexes["exact"])
+    summary["cascade"] = {
+        "enabled": CASCADE_ENABLED,
+        "min_margin": CASCADE_MIN_MARGINS,
+        "min_score": CASCADE_MIN_SCORE,
+        "category_classifier": indexes["category"]["ngram"] is not None,
+        "intent_classifier": indexes["intent"]["ngram"] is not None,
+    }
+    return summary
+
+def timed_import(name: str):
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    import_seconds.setdefault(name, round(time.perf_counter() - started, 3))
+    return module
+
+def import_torch():
+    """
+    torch / sentence_transformers 지연 import 후 GPU 사용 가능 여부 확인 (torch 백엔드에서만 필요)
+    """
+    global torch, SentenceTransformer, use_gpu, device
+    if torch is not None:
+        return
+    torch_module = timed_import("torch")
+    SentenceTransformer = timed_import("sentence_transformers").SentenceTransformer
+    if PRELOAD_MODELS:
+        # fork 전 마스터에서 OpenMP(GNU libgomp) 스레드 풀이 만들어지면 fork 된 워커의 torch 연산이 교착될 수 있으므로
+        # 마스터는 단일 스레드로만 로드하고, 워커 스레드 수는 after_fork 에서 설정
+        torch_module.set_num_threads(1)
+        try:
+            torch_module.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+    use_gpu = torch_module.cuda.is_available()
+    device = torch_module.device("cuda" if use_gpu else "cpu")
+    torch = torch_module
 
 app = FastAPI()
 
 # 모델 캐시 디렉토리 확인 및 생성
 os.makedirs(model_cache_dir, exist_ok=True)
 
-def load_models_async():
+def load_models_async(loader):
     """
-    백그라운드에서 모델 및 인덱스 로드 - 최적화된 버전
+    백그라운드에서 모델 및 인덱스 로드 - model_loader 가 로딩 스레드 하나에서만 호출
     """
-    global embedding_model, category_index, intent_index, category_labels, intent_labels, models_ready
+    global embedding_model, embedding_batcher, embedding_backend, embedding_precision, bucketed_encoder
+    global disk_embedding_cache
+    global label_indexes, warmup_report
+
+    # 임베딩 서비스 모드: 서비스 프로세스가 모델 로딩을 마칠 때까지 기다리기만 함
+    if embedding_service_client is not None:
+        with loader.component("embedding_service") as step:
+            service = wait_for_service(EMBEDDING_SERVICE_SOCKET, timeout=EMBEDDING_SERVICE_WAIT)
+            step["detail"] = f"pid={service.get('pid')}, index_version={service.get('index_version')}"
+            print(f"임베딩 서비스 연결 확인: {EMBEDDING_SERVICE_SOCKET} ({step['detail']})")
+        return
 
     start_time = time.time()
+
+    # 0. 무거운 ML 모듈 import (ONNX 백엔드면 torch 는 대체가 필요할 때만)
+    with loader.component("imports") as step:
+        faiss_module = timed_import("faiss")
+        if PRELOAD_MODELS:
+            # torch 와 같은 이유로 마스터의 faiss 검색(정확 일치 통합 테이블 등)도 OpenMP 스레드 풀을 만들지 않도록 단일 스레드
+            faiss_module.omp_set_num_threads(1)
+        timed_import("index_builder")
+        if EMBEDDING_BACKEND != "onnx":
+            import_torch()
+        step["detail"] = ", ".join(f"{name}={seconds}s" for name, seconds in import_seconds.items())
     print(f"모델 로딩 시작... (장치: {device})")
 
+    # 1. 임베딩 모델 로드 (EMBEDDING_MODEL_NAME, 인덱스 빌드 시 사용한 모델과 같아야 함)
+    model_name = EMBEDDING_MODEL_NAME
+
+    # 모델 캐시 경로 설정 - 다운로드 속도 향상
+    os.environ['TRANSFORMERS_CACHE'] = model_cache_dir
+
+    with loader.component("embedding_model") as step:
+        # 이전 시도에서 모델까지 로드하고 인덱스 단계에서 실패했으면 로드한 모델을 그대로 사용
+        model = embedding_model
+        if model is not None:
+            print("이전 로딩에서 준비된 임베딩 모델 재사용")
+
+        # ONNX Runtime 백엔드 (실패 시 torch 로 대체)
+        if model is None and EMBEDDING_BACKEND == "onnx":
+            model = load_onnx_encoder(model_name)
+
+        if model is None:
+            import_torch()
+
+        # 미리 준비된 모델 (fp32 가중치 로드와 양자화 과정 생략)
+        if model is None and USE_PREPARED_MODEL:
+            model = load_prepared_encoder(model_name)
+
+        if model is None:
+            # 모델 로드 시 최적화 옵션
+            model = SentenceTransformer(model_name, device=device, revision=EMBEDDING_MODEL_REVISION or None)
+            embedding_backend = "torch"
+            embedding_precision = "fp32"
+
+            # 메모리 사용량 최적화 (CPU에서 실행 시)
+            if not use_gpu:
+                # 모델 양자화 (메모리 사용량 감소)
+                try:
+                    quantize_sentence_transformer(model)
+                    embedding_precision = "int8"
+                    print("모델 양자화 적용됨 (메모리 최적화) - prepare_model.py 로 미리 준비하면 시작 시간 단축")
+                except Exception as e:
+                    print(f"모델 양자화 실패 (무시됨): {e}")
+        embedding_model = model
+        step["detail"] = f"{model_name} ({embedding_backend}" + \
+            (f", prepared {prepared_model_info['format']})" if prepared_model_info else ")")
+
+    with loader.component("encoder") as step:
+        # 길이 버킷 인코더 - 최대 토큰 수 제한, 토큰화 결과 캐시, 길이별 패딩
+        max_seq_length = min(EMBED_MAX_SEQ_LENGTH, embedding_model.max_seq_length or EMBED_MAX_SEQ_LENGTH)
+        embedding_model.max_seq_length = max_seq_length
+        bucketed_encoder = BucketedEncoder(
+            embedding_model.tokenizer,
+            forward_embeddings,
+            max_seq_length=max_seq_length,
+            buckets=EMBED_LENGTH_BUCKETS,
+            token_cache_size=EMBED_TOKEN_CACHE_SIZE,
+        )
+        print(f"길이 버킷 인코더 준비 (최대 토큰: {max_seq_length}, 버킷: {bucketed_encoder.buckets})")
+
+        # 동시 요청을 묶어서 인코딩하는 배치 스케줄러 시작
+        if embedding_batcher is not None:
+            embedding_batcher.stop()
+        embedding_batcher = EmbeddingBatcher(
+            encode_batch,
+            max_batch_size=EMBED_BATCH_MAX_SIZE,
+            max_wait_ms=EMBED_BATCH_MAX_WAIT_MS,
+        ).start()
+        print(f"임베딩 배치 스케줄러 시작 (최대 배치: {EMBED_BATCH_MAX_SIZE}, 최대 대기: {EMBED_BATCH_MAX_WAIT_MS}ms)")
+        step["detail"] = f"max_seq_length={max_seq_length}, batch={EMBED_BATCH_MAX_SIZE}"
+
+    # 디스크 임베딩 캐시 (재시도 시 이미 열려 있으면 그대로 사용 - 모델을 재사용하므로 키가 같음)
+    if disk_embedding_cache is None and not PRELOAD_MODELS:
+        disk_embedding_cache = open_disk_embedding_cache()
+
+    # 2, 3. 카테고리/의도 인덱스 로드 (파일이 없으면 해당 단계만 missing 으로 표시하고 계속,
+    #       파일이 있는데 사용할 수 없으면 로딩 실패 - MODEL_RETRY_SECONDS 후 요청이 들어오면 다시 시도)
+    # 버전은 파일을 읽기 전에 계산 - 읽는 도중 파일이 바뀌면 인덱스 감시가 다음 확인에서 다시 읽음
+    embedding_dim = embedding_model.get_sentence_embedding_dimension()
+    version = current_index_version()
+    indexes = {"version": version}
+    for name, (prefix, display_name) in LABEL_INDEX_FILES.items():
+        with loader.component(f"{name}_index") as step:
+            indexes[name] = load_label_set(name, embedding_dim)
+            describe_index_step(step, indexes[name]["index"], indexes[name]["labels"])
+    indexes["exact"] = build_joint_exact_table(indexes)
+
+    # 인덱스가 바뀌었으면 이전 버전으로 계산된 분류 결과는 모두 버림
+    label_indexes = indexes
+    result_cache.invalidate()
+    print(f"인덱스 버전: {version}")
+
+    # 로딩 결과 요약
+    elapsed = time.time() - start_time
+    ready_status = ["임베딩 모델"]
+    for name, (_, display_name) in LABEL_INDEX_FILES.items():
+        if indexes[name]["index"] is not None:
+            ready_status.append(f"{display_name} 인덱스")
+    print(f"모델 로딩 완료! 준비된 컴포넌트: {', '.join(ready_status)} (소요 시간: {elapsed:.2f}초)")
+
+    # 메모리 최적화를 위한 가비지 컬렉션 실행
+    import gc
+    gc.collect()
+    if use_gpu:
+        torch.cuda.empty_cache()
+
+    # 4. 워밍업 (준비 완료 보고 전에 실행)
+    # preload 마스터에서는 forward 를 실행하지 않음 - fork 된 워커가 after_fork 에서 각자 워밍업
+    if WARMUP_QUESTIONS > 0 and not PRELOAD_MODELS:
+        with loader.component("warmup") as step:
+            warmup_report = run_warmup(WARMUP_QUESTIONS, WARMUP_BATCH_SIZES)
+            step["detail"] = f"questions={warmup_report['questions']}, batch_sizes={WARMUP_BATCH_SIZES}"
+
+
+def latency_summary(timings_ms) -> dict:
+    timings = np.asarray(timings_ms, dtype=np.float64)
+    if not len(timings):
+        return {"runs": 0}
+    return {
+        "runs": int(len(timings)),
+        "p50_ms": round(float(np.percentile(timings, 50)), 3),
+        "p99_ms": round(float(np.percentile(timings, 99)), 3),
+        "mean_ms": round(float(timings.mean()), 3),
+    }
+
+
+def run_warmup(count: int, batch_sizes) -> dict:
+    """
+    샘플 질문을 배치 크기별로 인코딩하고 각 인덱스를 검색하여 코드 경로를 미리 실행
+    - 임베딩/결과 캐시와 배치 스케줄러를 거치지 않으므로 캐시에 영향 없음
+    - 첫 번째(콜드) 실행을 제외한 지연 시간을 p50/p99 로 기록
+    """
+    from category_samples import category_samples
+    from index_builder import collect_samples
+    from intent_samples import intent_samples
+
+    started = time.time()
+    sentences = collect_samples(category_samples)[0] + collect_samples(intent_samples)[0]
+    questions = random.Random(0).sample(sentences, min(count, len(sentences)))
+    batch_sizes = sorted({max(1, b) for b in batch_sizes}) or [1]
+
+    # 콜드 실행 (할당자 확장, 커널 초기화, 토크나이저 캐시)
+    for batch_size in batch_sizes:
+        bucketed_encoder.encode(questions[:batch_size])
+
+    encode_ms = {}
+    embeddings = None
+    for batch_size in batch_sizes:
+        timings = []
+        vectors = []
+        for start in range(0, len(questions), batch_size):
+            t0 = time.perf_counter()
+            vectors.append(bucketed_encoder.encode(questions[start:start + batch_size]))
+            timings.append((time.perf_counter() - t0) * 1000.0)
+        encode_ms[str(batch_size)] = latency_summary(timings)
+        if embeddings is None:
+            embeddings = np.ascontiguousarray(np.vstack(vectors), dtype=np.float32)
+
+    search_ms = {}
+    indexes = label_indexes
+    for name in LABEL_INDEX_FILES:
+        index = indexes[name]["index"]
+        if index is None:
+            continue
+        index.search(embeddings[:1], CLASSIFY_TOP_K)
+        timings = []
+        for i in range(len(embeddings)):
+            t0 = time.perf_counter()
+            index.search(embeddings[i:i + 1], CLASSIFY_TOP_K)
+            timings.append((time.perf_counter() - t0) * 1000.0)
+        search_ms[name] = latency_summary(timings)
+
+    report = {
+        "questions": len(questions),
+        "seconds": round(time.time() - started, 3),
+        "encode": encode_ms,
+        "search": search_ms,
+    }
+    single = encode_ms.get(str(batch_sizes[0]), {})
+    print(f"워밍업 완료 ({report['seconds']:.2f}초) - 배치 {batch_sizes[0]} 인코딩 p50 {single.get('p50_ms')}ms / "
+          f"p99 {single.get('p99_ms')}ms, 검색: " +
+          ", ".join(f"{name} p50 {v['p50_ms']}ms / p99 {v['p99_ms']}ms" for name, v in search_ms.items()))
+    return report
+
+
+def describe_index_step(step: dict, index, labels):
+    if index is None:
+        step["state"] = "missing"
+    else:
+        step["detail"] = f"labels={len(labels)}, vectors={index.ntotal}"
+
+
+# 모델/인덱스 로더 - 서버 시작 시 한 번만 시작하고, 엔드포인트는 준비 완료를 기다림
+model_loader = ModelLoader(load_models_async, name="모델")
+# 분류 요청이 모델 준비를 기다리는 최대 시간(초), 넘으면 "모델 준비 중..." 응답
+MODEL_READY_TIMEOUT = float(os.getenv("MODEL_READY_TIMEOUT", "30"))
+# 로딩 실패 후 분류 요청이 들어오면 이 시간(초)이 지난 뒤 로딩을 다시 시도
+MODEL_RETRY_SECONDS = float(os.getenv("MODEL_RETRY_SECONDS", "30"))
+
+
+def load_onnx_encoder(model_name: str):
+    """
+    onnx_encoder.py 로 변환해 둔 ONNX 모델 로드 - 실패 시 None
+    """
+    global embedding_backend, embedding_precision
     try:
-        # 1. 경량 임베딩 모델 로드 (대형 모델 대신 효율적인 모델 사용)
-        model_name = "intfloat/multilingual-e5-large-instruct"  # 더 빠른 로드를 위한 경량 모델
+        from onnx_encoder import OnnxEncoder, default_onnx_dir
+
+        model_dir = ONNX_MODEL_DIR or default_onnx_dir(model_name, model_cache_dir)
+        encoder = OnnxEncoder(
+            model_dir,
+            quantized=ONNX_QUANTIZED,
+            intra_op_threads=ONNX_INTRA_OP_THREADS,
+            inter_op_threads=ONNX_INTER_OP_THREADS,
+        )
+        if encoder.model_name and encoder.model_name != model_name:
+            print(f"ONNX 모델({encoder.model_name})이 설정된 모델({model_name})과 달라 사용하지 않음")
+            return None
+        embedding_backend = "onnx-int8" if ONNX_QUANTIZED else "onnx"
+        embedding_precision = "int8" if ONNX_QUANTIZED else "fp32"
+        print(f"ONNX Runtime 백엔드 로드 완료: {encoder.model_path}")
+        return encoder
+    except Exception as e:
+        print(f"ONNX 백엔드 로드 실패, torch 백엔드로 대체: {e}")
+        return None
+
+
+def load_prepared_encoder(model_name: str):
+    """
+    prepare_model.py 로 만든 모델 로드 - 없거나 모델/버전/체크섬이 맞지 않으면 None
+    """
+    global embedding_backend, embedding_precision, prepared_model_info
+    fmt = "fp16" if use_gpu else "int8"
+    model_dir = PREPARED_MODEL_DIR or default_prepared_dir(model_name, model_cache_dir, fmt)
+    try:
+        started = time.time()
+        model, manifest = load_prepared_model(model_dir, model_name, device=device, verify=PREPARED_MODEL_VERIFY,
+                                              revision=EMBEDDING_MODEL_REVISION)
+        if use_gpu and manifest["format"] == "int8":
+            print("int8 준비 모델은 CPU 전용이므로 GPU 에서는 사용하지 않음")
+            return None
+        embedding_backend = "torch"
+        embedding_precision = manifest["format"]
+        prepared_model_info = manifest
+        print(f"준비된 모델 로드 완료: {model_dir} ({manifest['format']}, {time.time() - started:.2f}초)")
+        return model
+    except FileNotFoundError:
+        print(f"준비된 모델 없음 ({model_dir}) - 원본 모델을 로드합니다.")
+    except Exception as e:
+        print(f"준비된 모델 로드 실패, 원본 모델로 대체: {e}")
+    return None
 
-        # 모델 캐시 경로 설정 - 다운로드 속도 향상
-        os.environ['TRANSFORMERS_CACHE'] = model_cache_dir
 
-        # 모델 로드 시 최적화 옵션
-        embedding_model = SentenceTransformer(model_name, device=device)
+def label_index_problem(prefix: str, index, labels, label_ids, meta: dict):
+    """인덱스 행 수, 레이블 id 범위, 메타데이터에 기록된 빌드 결과물이 서로 맞지 않으면 그 이유, 맞으면 None"""
+    from index_builder import stale_artifacts
 
-        # 메모리 사용량 최적화 (CPU에서 실행 시)
-        if not use_gpu:
-            # 모델 양자화 (메모리 사용량 감소)
+    if len(label_ids) != index.ntotal:
+        return f"레이블 id 수({len(label_ids)})와 인덱스 벡터 수({index.ntotal})가 다름"
+    if meta.get("ntotal") is not None and meta["ntotal"] != index.ntotal:
+        return f"메타데이터 벡터 수({meta['ntotal']})와 인덱스 벡터 수({index.ntotal})가 다름"
+    if len(label_ids) and (int(label_ids.min()) < 0 or int(label_ids.max()) >= len(labels)):
+        return f"레이블 id 가 레이블 테이블({len(labels)}개) 범위를 벗어남"
+    stale = stale_artifacts(prefix, meta)
+    if stale:
+        return f"메타데이터 기록과 다른 파일 (빌드 중이거나 다른 빌드): {', '.join(stale)}"
+    return None
+
+
+def load_label_index(prefix: str, display_name: str, expected_dim=None):
+    """
+    {prefix}.index 와 레이블 테이블/레이블 id 로드
+    - 다른 모델로 빌드되었거나 차원이 맞지 않는 인덱스는 사용하지 않음
+    - 반환: (인덱스, 레이블 이름 배열, 인덱스 행별 레이블 id, 메타데이터), 실패 시 인덱스는 None
+    - 파일은 있는데 사용할 수 없으면 메타데이터의 "error" 에 사유를 기록 (파일이 없는 경우와 구분)
+    """
+    from index_builder import (
+        apply_search_params, build_flat_index, build_label_table, compute_prototypes, has_label_arrays,
+        load_label_arrays, read_index, read_index_meta,
+    )
+
+    index = None
+    labels = np.array([], dtype=object)
+    label_ids = np.array([], dtype=np.int32)
+    meta = {}
+    error = None
+    try:
+        if has_label_arrays(prefix) and os.path.exists(f"{prefix}.index"):
+            print(f"{display_name} 인덱스 로딩 중...")
+            labels, label_ids, embeddings = load_label_arrays(prefix, mmap=INDEX_MMAP)
+
+            # 인덱스 파일 로드를 위한 예외 처리 강화
             try:
-                from torch.quantization import quantize_dynamic
-                embedding_model.model = quantize_dynamic(
-                    embedding_model.model, {torch.nn.Linear}, dtype=torch.qint8
-                )
-                print("모델 양자화 적용됨 (메모리 최적화)")
+                index = read_index(prefix, mmap=INDEX_MMAP)
+                meta = read_index_meta(prefix)
+                print(f"{display_name} 인덱스 로드 성공 (레이블: {len(labels)}개, 벡터: {index.ntotal}개, "
+                      f"종류: {meta.get('index_type', 'flat')})")
             except Exception as e:
-                print(f"모델 양자화 실패 (무시됨): {e}")
+                error = f"인덱스 파일 로드 실패: {e}"
 
-        # 2. 카테고리 인덱스 로드 (예외 처리 및 로깅 강화)
-        try:
-            if os.path.exists("question_categories.pkl") and os.path.exists("question_categories.index"):
-                print("카테고리 인덱스 로딩 중...")
-                with open("question_categories.pkl", "rb") as f:
-                    data = pickle.load(f)
-                    category_labels = data["labels"]
+            # 인덱스를 만든 모델과 현재 모델이 다르면 검색 결과가 무의미하므로 사용하지 않음
+            built_with = meta.get("model_name")
+            if index is not None and built_with and built_with != EMBEDDING_MODEL_NAME:
+                error = f"빌드 모델({built_with})과 현재 모델({EMBEDDING_MODEL_NAME})이 다름"
+                index = None
+            if index is not None and expected_dim and index.d != expected_dim:
+                error = f"인덱스 차원({index.d})과 임베딩 차원({expected_dim})이 다름"
+                index = None
+            # 인덱스와 레이블/메타데이터가 같은 빌드인지 확인 (빌드 도중이거나 파일이 섞였으면 사용하지 않음)
+            if index is not None:
+                error = label_index_problem(prefix, index, labels, label_ids, meta)
+                if error:
+                    index = None
+            if error:
+                print(f"{display_name} 인덱스 사용 안 함: {error}")
 
-                # 인덱스 파일 로드를 위한 예외 처리 강화
-                try:
-                    category_index = faiss.read_index("question_categories.index")
-                    print(f"카테고리 인덱스 로드 성공 (개수: {len(category_labels)})")
-                except Exception as e:
-                    print(f"카테고리 인덱스 파일 로드 실패: {e}")
-            else:
-                print("카테고리 인덱스 파일이 존재하지 않음")
-        except Exception as e:
-            print(f"카테고리 인덱스 로드 과정 실패: {e}")
+            # 빌드 시 기록된 검색 파라미터 복원 (환경 변수가 있으면 우선)
+            if index is not None:
+                params = dict(meta.get("search_params", {}))
+                if FAISS_EF_SEARCH and "efSearch" in params:
+                    params["efSearch"] = int(FAISS_EF_SEARCH)
+                if FAISS_NPROBE and "nprobe" in params:
+                    params["nprobe"] = int(FAISS_NPROBE)
+                if FAISS_REFINE_K_FACTOR and "k_factor_rf" in params:
+                    params["k_factor_rf"] = float(FAISS_REFINE_K_FACTOR)
+                apply_search_params(index, params)
+                meta["search_params"] = params
+
+            # prototype 서빙 모드 - 전체 샘플 인덱스를 레이블별 대표 벡터로 축약
+            if index is not None and LABEL_INDEX_MODE == "prototype" and meta.get("mode", "knn") == "knn" \
+                    and embeddings is not None:
+                vectors, proto_labels = compute_prototypes(embeddings, labels[label_ids], LABEL_PROTOTYPES_PER_LABEL)
+                labels, label_ids = build_label_table(proto_labels)
+                index = build_flat_index(vectors)
+                meta = dict(meta, index_type="flat", search_params={}, mode="prototype")
+                print(f"{display_name} 인덱스를 prototype 모드로 축약 (대표 벡터: {index.ntotal}개)")
+        else:
+            print(f"{display_name} 인덱스 파일이 존재하지 않음")
+    except Exception as e:
+        error = f"인덱스 로드 과정 실패: {e}"
+        print(f"{display_name} {error}")
+        index = None
+        meta = {}
+
+    if error:
+        meta = dict(meta, error=error)
+    return index, labels, label_ids, meta
+
+
+def load_cascade_classifier(prefix: str, display_name: str, index):
+    """
+    {prefix}.ngram.npz 1차 분류기 로드 (인덱스가 없거나 파일이 없으면 None)
+    """
+    if index is None or not CASCADE_ENABLED:
+        return None
+    from index_builder import load_ngram_classifier
 
-        # 3. 의도 인덱스 로드
+    try:
+        classifier = load_ngram_classifier(prefix)
+    except Exception as e:
+        print(f"{display_name} 1차 분류기 로드 실패 (e5 만 사용): {e}")
+        return None
+    if classifier is None:
+        print(f"{display_name} 1차 분류기 파일이 없어 e5 만 사용합니다.")
+    else:
+        print(f"{display_name} 1차 분류기 로드 (레이블: {len(classifier.labels)}개, {classifier.nbytes() / 1024:.1f}KB)")
+    return classifier
+
+
+def load_label_set(name: str, expected_dim=None) -> dict:
+    """
+    분류 종류 하나의 인덱스, 레이블, 정확 일치 테이블, 1차 분류기를 새 dict 로 로드
+    - 인덱스 파일이 없으면 빈 인덱스, 파일은 있는데 사용할 수 없으면 ValueError
+      (준비 완료인데 인덱스가 없는 상태로 서빙하지 않고 로딩 실패/재로드 거부로 처리)
+    """
+    from index_builder import load_exact_table, stale_artifacts
+
+    prefix, display_name = LABEL_INDEX_FILES[name]
+    index, labels, label_ids, meta = load_label_index(prefix, display_name, expected_dim)
+    if meta.get("error"):
+        raise ValueError(f"{display_name} 인덱스 사용 불가: {meta['error']}")
+    exact = load_exact_table(prefix) if index is not None else {}
+    ngram = load_cascade_classifier(prefix, display_name, index)
+    # 인덱스를 읽은 뒤 exact/1차 분류기를 읽는 사이에 새 빌드 파일로 바뀌었으면 묶음 전체를 사용하지 않음
+    stale = stale_artifacts(prefix, meta) if index is not None else []
+    if stale:
+        raise ValueError(f"{display_name} 인덱스 사용 불가: 로딩 중 파일이 바뀜 ({', '.join(stale)})")
+    return {
+        "index": index,
+        "labels": labels,
+        "label_ids": label_ids,
+        "meta": meta,
+        "exact": exact,
+        "ngram": ngram,
+    }
+
+
+def build_joint_exact_table(indexes: dict) -> dict:
+    """
+    정규화된 샘플 문장 → {카테고리/의도 결과} 통합 테이블 - 정확 일치 질문은 양쪽 모두 인코딩 없이 응답
+
+    - 두 exact 테이블에 모두 있는 문장은 양쪽 레이블을 그대로 사용 (신뢰도 1.0)
+    - 한쪽에만 있는 문장은 빌드 시 저장된 샘플 임베딩({prefix}.embeddings.npy 행)으로 다른 쪽 인덱스를 검색해 채움
+    - 임베딩 행이 없는 문장(prototype 빌드, 이전 형식)은 한쪽 결과만 저장하고 나머지는 요청 시 분류
+    """
+    from index_builder import load_sample_embeddings
+
+    joint = {}
+    for name, (prefix, display_name) in LABEL_INDEX_FILES.items():
+        if indexes[name]["index"] is None:
+            continue
+        for key, (label, _) in indexes[name]["exact"].items():
+            joint.setdefault(key, {})[name] = {"label": label, "confidence": 1.0, "runner_up": []}
+
+    searched = 0
+    for name, (prefix, display_name) in LABEL_INDEX_FILES.items():
+        exact = indexes[name]["exact"]
+        if indexes[name]["index"] is None or not exact:
+            continue
         try:
-            if os.path.exists("intent_categories.pkl") and os.path.exists("intent_categories.index"):
-                print("의도 인덱스 로딩 중...")
-                with open("intent_categories.pkl", "rb") as f:
-                    intent_data = pickle.load(f)
-                    intent_labels = intent_data["labels"]
+            embeddings = load_sample_embeddings(prefix)
+        except Exception as e:
+            print(f"{display_name} 샘플 임베딩 로드 실패 (정확 일치 교차 분류 생략): {e}")
+            continue
+        if embeddings is None:
+            continue
 
-                try:
-                    intent_index = faiss.read_index("intent_categories.index")
-                    print(f"의도 인덱스 로드 성공 (개수: {len(intent_labels)})")
-                except Exception as e:
-                    print(f"의도 인덱스 파일 로드 실패: {e}")
-            else:
-                print("의도 인덱스 파일이 존재하지 않음")
+        for other in LABEL_INDEX_FILES:
+            index = indexes[other]["index"]
+            if other == name or index is None or index.d != embeddings.shape[1]:
+                continue
+            keys = [key for key, (_, row) in exact.items()
+                    if row is not None and row < len(embeddings) and other not in joint[key]]
+            if not keys:
+                continue
+            rows = np.fromiter((exact[key][1] for key in keys), dtype=np.int64, count=len(keys))
+            queries = np.ascontiguousarray(embeddings[rows], dtype=np.float32)
+            D, I = index.search(queries, CLASSIFY_TOP_K)
+            for key, distances, ids in zip(keys, D, I):
+                joint[key][other] = vote_labels(distances, ids, indexes[other]["label_ids"], indexes[other]["labels"])
+            searched += len(keys)
+
+    complete = sum(len(entry) == len(LABEL_INDEX_FILES) for entry in joint.values())
+    print(f"정확 일치 통합 테이블: 문장 {len(joint)}개 (양쪽 결과 {complete}개, 교차 검색 {searched}건)")
+    return joint
+
+
+def current_index_version() -> str:
+    """디스크에 있는 인덱스 파일들의 버전 (모델 이름 포함)"""
+    from index_builder import artifact_version
+
+    return artifact_version([prefix for prefix, _ in LABEL_INDEX_FILES.values()], extra=(EMBEDDING_MODEL_NAME,))
+
+
+# 인덱스 다시 읽기 - 모델은 그대로 두고 인덱스 파일만 백그라운드에서 읽어 교체
+# 0보다 크면 이 간격(초)으로 인덱스 파일 버전을 확인하고, 두 번 연속 같은 새 버전이면(빌드 완료) 다시 읽음
+INDEX_WATCH_SECONDS = float(os.getenv("INDEX_WATCH_SECONDS", "0"))
+# 관리 API 토큰 (X-Admin-Token 헤더) - 설정하지 않으면 관리 API 비활성화
+# (리버스 프록시 뒤에서는 모든 요청이 로컬 주소로 보이므로 주소로 허용하지 않음)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+index_reload_lock = threading.Lock()
+index_reload_status = {
+    "reloads": 0, "failures": 0, "last_checked_at": None, "last_reload_at": None,
+    "last_seconds": None, "last_error": None, "failed_version": None,
+}
+
+
+def reload_label_indexes(force=False) -> dict:
+    """
+    디스크의 인덱스가 로드된 버전과 다르면 새로 읽어 검증 후 한 번에 교체
+
+    - 모델/차원/메타데이터 기록(내용 해시)이 맞지 않는 인덱스가 있거나 이미 사용 중인 인덱스를
+      잃게 되는 경우 전체 교체를 취소하고 기존 인덱스 유지
+    - 새 인덱스 묶음을 만든 뒤 참조 하나만 바꾸므로 진행 중인 요청은 이전 묶음(이전 mmap 파일)으로 끝까지 처리
+    - 결과 캐시는 버전별로 저장되므로 교체 후 이전 버전 결과는 사용되지 않음
+    """
+    global label_indexes
+    if not model_loader.ready:
+        return {"status": "not_ready", "state": model_loader.state}
+    if not index_reload_lock.acquire(blocking=False):
+        return {"status": "busy"}
+    version = None
+    try:
+        started = time.time()
+        index_reload_status["last_checked_at"] = started
+        current = label_indexes
+        version = current_index_version()
+        if version == current["version"] and not force:
+            return {"status": "unchanged", "version": version}
+
+        print(f"인덱스 다시 읽기 시작 ({current['version']} → {version})")
+        embedding_dim = embedding_model.get_sentence_embedding_dimension()
+        indexes = {"version": version}
+        errors = []
+        for name, (_, display_name) in LABEL_INDEX_FILES.items():
+            try:
+                indexes[name] = load_label_set(name, embedding_dim)
+            except ValueError as e:
+                errors.append(str(e))
+                continue
+            index = indexes[name]["index"]
+            if index is None and current[name]["index"] is not None:
+                errors.append(f"{display_name} 인덱스를 사용할 수 없음")
+            elif index is not None:
+                # mmap 페이지를 미리 읽어 교체 직후 첫 요청이 느려지지 않도록 함
+                index.search(np.zeros((1, index.d), dtype=np.float32), CLASSIFY_TOP_K)
+
+        if not errors:
+            indexes["exact"] = build_joint_exact_table(indexes)
+        if errors:
+            index_reload_status["failures"] += 1
+            index_reload_status.update(last_error=", ".join(errors), failed_version=version)
+            print(f"인덱스 다시 읽기 취소, 기존 버전({current['version']}) 유지: {', '.join(errors)}")
+            return {"status": "rejected", "version": current["version"], "rejected_version": version,
+                    "errors": errors}
+
+        label_indexes = indexes
+        result_cache.invalidate()
+        seconds = round(time.time() - started, 3)
+        index_reload_status.update(reloads=index_reload_status["reloads"] + 1, last_reload_at=time.time(),
+                                   last_seconds=seconds, last_error=None, failed_version=None)
+        print(f"인덱스 교체 완료: {version} ({seconds}초)")
+        return {
+            "status": "reloaded",
+            "version": version,
+            "previous_version": current["version"],
+            "seconds": seconds,
+            **{name: len(indexes[name]["labels"]) for name in LABEL_INDEX_FILES},
+        }
+    except Exception as e:
+        index_reload_status["failures"] += 1
+        index_reload_status.update(last_error=str(e), failed_version=version)
+        print(f"인덱스 다시 읽기 실패 (기존 인덱스 유지): {e}")
+        return {"status": "failed", "error": str(e)}
+    finally:
+        index_reload_lock.release()
+
+
+def watch_label_indexes(interval: float):
+    """
+    인덱스 파일 감시 스레드 - 빌드 도중 일부 파일만 바뀐 상태를 읽지 않도록
+    같은 새 버전이 두 번 연속 확인되었을 때만 다시 읽음 (검증에 실패한 버전은 파일이 다시 바뀔 때까지 재시도하지 않음)
+    """
+    seen = None
+    while True:
+        time.sleep(interval)
+        if not model_loader.ready:
+            continue
+        try:
+            version = current_index_version()
         except Exception as e:
-            print(f"의도 인덱스 로드 과정 실패: {e}")
-
-        # 모델 로딩 완료 및 통계 출력
-        models_ready = embedding_model is not None
-        elapsed = time.time() - start_time
-
-        # 로딩 결과 요약
-        ready_status = []
-        if embedding_model is not None:
-            ready_status.append("임베딩 모델")
-        if category_index is not None:
-            ready_status.append("카테고리 인덱스")
-        if intent_index is not None:
-            ready_status.append("의도 인덱스")
-
-        if ready_status:
-            print(f"모델 로딩 완료! 준비된 컴포넌트: {', '.join(ready_status)} (소요 시간: {elapsed:.2f}초)")
-            # 메모리 최적화를 위한 가비지 컬렉션 실행
-            import gc
-            gc.collect()
-            if use_gpu:
-                torch.cuda.empty_cache()
+            print(f"인덱스 파일 확인 실패: {e}")
+            continue
+        if version in (label_indexes["version"], index_reload_status["failed_version"]):
+            seen = None
+        elif version == seen:
+            reload_label_indexes()
         else:
-            print(f"모든 모델 로딩 실패 (소요 시간: {elapsed:.2f}초)")
+            seen = version
 
-    except Exception as e:
-        print(f"모델 로딩 중 예상치 못한 오류 발생: {e}")
 
-    finally:
-        # 로딩 스레드 참조 제거
-        global loading_thread
-        loading_thread = None
+index_watcher = None
+
+def start_index_watcher():
+    """INDEX_WATCH_SECONDS 가 설정되어 있으면 감시 스레드 시작 (프로세스마다 한 번, 임베딩 서비스 모드에서는 서비스 쪽에서)"""
+    global index_watcher
+    if INDEX_WATCH_SECONDS <= 0 or embedding_service_client is not None or index_watcher is not None:
+        return
+    index_watcher = threading.Thread(target=watch_label_indexes, args=(INDEX_WATCH_SECONDS,),
+                                     name="index-watcher", daemon=True)
+    index_watcher.start()
+    print(f"인덱스 파일 감시 시작 (간격: {INDEX_WATCH_SECONDS}초)")
+
+def forward_embeddings(input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+    """
+    토큰화된 배치를 현재 백엔드로 임베딩 (풀링/정규화 포함)
+    """
+    if embedding_backend != "torch":
+        return embedding_model.forward(input_ids, attention_mask)
+
+    features = {
+        "input_ids": torch.from_numpy(input_ids).to(device),
+        "attention_mask": torch.from_numpy(attention_mask).to(device),
+    }
+    # CPU/GPU 메모리 최적화를 위한 with 컨텍스트
+    with torch.no_grad():
+        return embedding_model(features)["sentence_embedding"].float().cpu().numpy()
+
 
+def encode_batch(texts):
+    """
+    배치 스케줄러가 모은 질문들을 길이 버킷별로 나눠 한 번에 임베딩
+    """
+    return bucketed_encoder.encode(texts)
 
-# 서버 시작 시 백그라운드에서 모델 로딩
+
+# 서버 시작 시 백그라운드에서 모델 로딩 (로더가 중복 시작을 막음)
 @app.on_event("startup")
 async def startup_event():
-    global loading_thread
-    if loading_thread is None or not loading_thread.is_alive():
-        loading_thread = threading.Thread(target=load_models_async, daemon=True)
-        loading_thread.start()
+    model_loader.start()
+    start_index_watcher()
+
+def vote_labels(distances, ids, label_ids, label_names) -> dict:
+    """
+    top-k 검색 결과를 거리 가중 투표로 집계하여 레이블, 신뢰도, 차순위 후보 반환
+    """
+    valid = ids >= 0
+    if not valid.any():
+        return {"label": "알 수 없음", "confidence": 0.0, "runner_up": []}
+
+    # 가까울수록 큰 가중치 (L2 거리 기반 softmax 형태), 레이블별 합산 후 정규화
+    d = distances[valid]
+    weights = np.exp(-(d - d.min()) / CLASSIFY_VOTE_TEMPERATURE)
+    scores = np.bincount(label_ids[ids[valid]], weights=weights, minlength=len(label_names))
+    scores /= scores.sum()
+
+    top_n = min(CLASSIFY_RUNNER_UPS + 1, len(scores))
+    top = np.argpartition(-scores, top_n - 1)[:top_n]
+    top = top[np.argsort(-scores[top])]
+    top = top[scores[top] > 0]
+
+    return {
+        "label": label_names[top[0]],
+        "confidence": round(float(scores[top[0]]), 4),
+        "runner_up": [
+            {"label": label_names[i], "score": round(float(scores[i]), 4)} for i in top[1:]
+        ],
+    }
+
+def status_result(message: str) -> dict:
+    """모델 준비 중/오류 등 분류 결과가 없을 때의 응답"""
+    return {
+        "category": message,
+        "intent": message,
+        "category_confidence": 0.0,
+        "intent_confidence": 0.0,
+        "category_runner_up": [],
+        "intent_runner_up": [],
+        "source": None,
+        "index_version": None,
+    }
 
 # 예측 함수 (지연 로딩 포함)
-def predict_category(question: str) -> str:
+def predict_labels(question: str) -> dict:
     """
-    카테고리 예측 함수 - 모델 준비 상태 확인 및 예외 처리
+    카테고리/의도 통합 예측 함수 - 임베딩을 한 번만 생성하여 두 인덱스를 함께 검색
     """
-    global models_ready, loading_thread
+    count_classify("requests")
+    key = normalize_text(question)
+
+    # 요청 하나는 처음 잡은 인덱스 묶음만 사용 (처리 중 인덱스가 교체되어도 레이블/인덱스가 섞이지 않음)
+    indexes = label_indexes
+    version = indexes["version"]
+
+    # 0. 같은 인덱스 버전으로 분류한 적이 있는 질문은 캐시된 결과 반환
+    if version is not None:
+        cached = result_cache.get(key, version)
+        if cached is not None:
+            return cached
+
+    result = status_result("모델 준비 중...")
+    result["index_version"] = version
+
+    # 1. 정규화한 질문이 샘플 문장과 정확히 일치하면 통합 테이블의 카테고리/의도 결과를 인코딩 없이 사용
+    # 2. 아니면 문자 n-gram 1차 분류기가 확실한(margin 이 큰) 경우에만 응답
+    pending = []
+    sources = set()
+    exact = indexes["exact"].get(key) or {}
+    for name in LABEL_INDEX_FILES:
+        index, labels, label_ids, ngram = (
+            indexes[name][field] for field in ("index", "labels", "label_ids", "ngram")
+        )
+        if name in exact:
+            result[name] = exact[name]["label"]
+            result[f"{name}_confidence"] = exact[name]["confidence"]
+            result[f"{name}_runner_up"] = exact[name]["runner_up"]
+            sources.add("exact")
+            continue
+        if index is None or not len(labels):
+            continue
+        if CASCADE_ENABLED and ngram is not None:
+            guess = ngram.predict(question, CLASSIFY_VOTE_TEMPERATURE, CLASSIFY_RUNNER_UPS)
+            if accepts(guess, CASCADE_MIN_MARGINS[name], CASCADE_MIN_SCORE):
+                result[name] = guess["label"]
+                result[f"{name}_confidence"] = guess["confidence"]
+                result[f"{name}_runner_up"] = guess["runner_up"]
+                sources.add("ngram")
+                count_classify(f"{name}_ngram")
+                continue
+            count_classify(f"{name}_escalated")
+        pending.append((name, index, labels, label_ids))
 
-    # 모델이 준비되지 않았고, 로딩 중이 아니면 로딩 시작
-    if not models_ready and (loading_thread is None or not loading_thread.is_alive()):
-        loading_thread = threading.Thread(target=load_models_async, daemon=True)
-        loading_thread.start()
-        return "모델 로딩 중..."
+    # 검색할 인덱스가 하나도 없으면 인코딩 없이 상태 응답 (캐시하지 않음 - 인덱스가 생기면 바로 분류)
+    if not pending and not sources:
+        if not model_loader.ready:
+            model_loader.retry(MODEL_RETRY_SECONDS)
+            return status_result("모델 로딩 실패" if model_loader.state == "failed" else "모델 준비 중...")
+        result = status_result("인덱스 없음")
+        result["index_version"] = version
+        return result
 
-    # 모델이 아직 준비되지 않았으면 대기 메시지 반환
-    if not models_ready or embedding_model is None or category_index is None or not category_labels:
-        return "모델 준비 중..."
+    if not pending:
+        source = "ngram" if "ngram" in sources else "exact"
+        count_classify(f"{source}_hits")
+        result["source"] = source
+        if source == "ngram" and version is not None:
+            result_cache.put(key, version, result)
+        return result
+
+    # 모델이 아직 준비되지 않았으면 대기 메시지 반환 (임베딩 서비스 프로세스는 classify() 를 거치지 않으므로 여기서 재시도)
+    if not model_loader.ready:
+        model_loader.retry(MODEL_RETRY_SECONDS)
+        return status_result("모델 로딩 실패" if model_loader.state == "failed" else "모델 준비 중...")
 
     # 예측 시도
     try:
-        # CPU/GPU 메모리 최적화를 위한 with 컨텍스트
-        with torch.no_grad():
-            # 임베딩 생성
-            embedding = embedding_model.encode([question], show_progress_bar=False)
-            # 벡터 검색
-            D, I = category_index.search(np.array(embedding, dtype=np.float32), k=1)
-            # 결과 반환
-            return category_labels[I[0][0]]
+        # 3. 임베딩 생성 (카테고리/의도 검색에 공통 사용, 캐시 미스 시 동시 요청과 함께 배치 처리)
+        embedding = get_embedding(question)[np.newaxis, :]
+        count_classify("encoded")
+
+        # 벡터 검색 후 top-k 거리 가중 투표 (앞 단계에서 결정되지 않은 항목만)
+        for name, index, labels, label_ids in pending:
+            D, I = index.search(embedding, k=CLASSIFY_TOP_K)
+            vote = vote_labels(D[0], I[0], label_ids, labels)
+            result[name] = vote["label"]
+            result[f"{name}_confidence"] = vote["confidence"]
+            result[f"{name}_runner_up"] = vote["runner_up"]
+        result["source"] = "embedding"
+        if version is not None:
+            result_cache.put(key, version, result)
+        return result
     except Exception as e:
-        print(f"카테고리 예측 오류: {e}")
-        return "알 수 없음"
+        print(f"질문 분류 오류: {e}")
+        return status_result("알 수 없음")
 
-# 의도 예측 함수도 동일한 방식으로 구현
-def predict_intent(question: str) -> str:
+async def classify(question: str) -> dict:
     """
-    의도 예측 함수 - 모델 준비 상태 확인 및 예외 처리
+    이벤트 루프에서는 결과만 기다리고, 실제 분류는 전용 스레드 풀에서 실행
     """
-    if not models_ready or embedding_model is None or intent_index is None or not intent_labels:
-        return "모델 준비 중..."
+    # 이전 로딩이 실패했으면 (backoff 후) 다시 시작하고, 로딩 중이면 준비될 때까지(최대 MODEL_READY_TIMEOUT) 기다림
+    # (임베딩 서비스 모드의 로딩은 서비스 연결 확인뿐이므로 바로 다시 시도)
+    model_loader.retry(0 if embedding_service_client is not None else MODEL_RETRY_SECONDS)
+    await model_loader.wait_ready(MODEL_READY_TIMEOUT)
 
-    try:
-        with torch.no_grad():
-            embedding = embedding_model.encode([question], show_progress_bar=False)
-            D, I = intent_index.search(np.array(embedding, dtype=np.float32), k=1)
-            return intent_labels[I[0][0]]
-    except Exception as e:
-        print(f"의도 예측 오류: {e}")
-        return "알 수 없음"
+    # 임베딩 서비스 모드: 인코딩/검색은 서비스 프로세스에서 (여러 워커의 요청이 함께 배치됨)
+    if embedding_service_client is not None:
+        if not model_loader.ready:
+            return status_result("모델 준비 중...")
+        try:
+            return await embedding_service_client.classify(question)
+        except Exception as e:
+            print(f"임베딩 서비스 요청 실패: {e}")
+            return status_result("알 수 없음")
 
-# 글로벌 변수로 모델, 인덱스 준비 상태 추적
-model_ready = False
-embedding_model = None
-category_index = None
-intent_index = None
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(classification_executor, predict_labels, question)
 
-# 비동기 로딩 시작
-threading.Thread(target=load_models_async, daemon=True).start()
+def predict_category(question: str) -> str:
+    """
+    카테고리 예측 함수 - predict_labels 결과 중 카테고리만 반환
+    """
+    return predict_labels(question)["category"]
 
-# 공통 모델 변수 초기화
-category_labels = []
-intent_labels = []
+def predict_intent(question: str) -> str:
+    """
+    의도 예측 함수 - predict_labels 결과 중 의도만 반환
+    """
+    return predict_labels(question)["intent"]
 
-# 임베딩 캐시
-embedding_cache = {}
+def get_embedding(text: str) -> np.ndarray:
+    """
+    메모리 캐시 → 디스크 캐시 순으로 조회하고, 없을 때만 배치 스케줄러를 통해 인코딩
+    """
+    embedding = embedding_cache.get(text)
+    if embedding is not None:
+        return embedding
 
-def get_embedding(text: str):
-    if text in embedding_cache:
-        return embedding_cache[text]
+    if disk_embedding_cache is not None:
+        embedding = disk_embedding_cache.get(text)
+        if embedding is not None:
+            embedding_cache.put(text, embedding)
+            return embedding
 
-    embedding = embedding_model.encode([text])[0]
-    embedding_cache[text] = embedding
+    embedding = embedding_batcher.encode(text, timeout=EMBED_TIMEOUT_SECONDS)
+    embedding_cache.put(text, embedding)
+    if disk_embedding_cache is not None:
+        disk_embedding_cache.put(text, embedding)
     return embedding
 
-app = FastAPI()
 # 정적 파일 및 템플릿 설정
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
@@ -232,6 +1089,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 종료 시 디스크 캐시의 대기 중인 쓰기 반영
+@app.on_event("shutdown")
+async def shutdown_event():
+    if disk_embedding_cache is not None:
+        disk_embedding_cache.close()
+
 # 대화 상태를 유지하기 위한 메모리 기반 세션 관리
 active_sessions = {}
 
@@ -259,29 +1122,94 @@ async def index(request: Request, session_id: str = None, q: str = Form(None)):
 @app.get("/api/status")
 async def check_model_status():
     """모델 및 인덱스 로딩 상태 확인 API"""
+    service = None
+    if embedding_service_client is not None:
+        service = embedding_service_client.stats()
+        try:
+            service["remote"] = await embedding_service_client.status()
+        except Exception as e:
+            service["remote_error"] = str(e)
+
+    indexes = label_indexes
+    category, intent = indexes["category"], indexes["intent"]
     return {
-        "ready": models_ready,
+        "ready": model_loader.ready,
+        "state": model_loader.state,
+        "loader": model_loader.status(),
         "components": {
             "embedding_model": embedding_model is not None,
-            "category_index": category_index is not None,
-            "intent_index": intent_index is not None
+            "category_index": category["index"] is not None,
+            "intent_index": intent["index"] is not None
         },
         "stats": {
-            "category_count": len(category_labels) if category_labels else 0,
-            "intent_count": len(intent_labels) if intent_labels else 0,
-            "device": str(device)
-        }
+            "category_count": len(category["labels"]),
+            "intent_count": len(intent["labels"]),
+            "category_vectors": category["index"].ntotal if category["index"] is not None else 0,
+            "intent_vectors": intent["index"].ntotal if intent["index"] is not None else 0,
+            "device": str(device),
+            "embedding_model": EMBEDDING_MODEL_NAME,
+            "embedding_backend": embedding_backend,
+            "prepared_model": {k: prepared_model_info.get(k) for k in ("format", "sha256", "created_at")}
+            if prepared_model_info else None,
+            "index_mode": LABEL_INDEX_MODE,
+            "index_mmap": INDEX_MMAP,
+            "top_k": CLASSIFY_TOP_K,
+            "index_version": indexes["version"],
+            "category_index_type": category["meta"].get("index_type"),
+            "category_compression": category["meta"].get("compression", "none"),
+            "category_transform": category["meta"].get("transform", "none"),
+            "category_search_params": category["meta"].get("search_params"),
+            "intent_index_type": intent["meta"].get("index_type"),
+            "intent_compression": intent["meta"].get("compression", "none"),
+            "intent_transform": intent["meta"].get("transform", "none"),
+            "intent_search_params": intent["meta"].get("search_params"),
+            "classify_workers": CLASSIFY_WORKERS,
+            "preload": PRELOAD_MODELS
+        },
+        "process": dict(pid=os.getpid(), **read_memory_mb()),
+        "embedding_service": service,
+        "batcher": embedding_batcher.stats() if embedding_batcher is not None else None,
+        "classify": classify_summary(),
+        "encoder": bucketed_encoder.stats() if bucketed_encoder is not None else None,
+        "warmup": warmup_report,
+        "startup": {"main_import_seconds": main_import_seconds, "import_seconds": import_seconds},
+        "index_reload": dict(index_reload_status, watch_seconds=INDEX_WATCH_SECONDS),
+        "result_cache": result_cache.stats(),
+        "embedding_cache": embedding_cache.stats(),
+        "disk_embedding_cache": disk_embedding_cache.stats() if disk_embedding_cache is not None else None
     }
 
+@app.post("/api/admin/reload-indexes")
+async def reload_indexes(request: Request, force: bool = Query(False)):
+    """
+    인덱스 파일을 다시 읽어 교체 (모델은 다시 로드하지 않음) - 디스크 버전이 같으면 force 일 때만 다시 읽음
+    """
+    if not ADMIN_TOKEN:
+        return JSONResponse(status_code=403,
+                            content={"error": "ADMIN_TOKEN 이 설정되지 않아 관리 API 가 비활성화되어 있습니다"})
+    if not hmac.compare_digest(request.headers.get("x-admin-token", "").encode(), ADMIN_TOKEN.encode()):
+        return JSONResponse(status_code=403, content={"error": "관리 토큰이 올바르지 않습니다"})
+
+    # 임베딩 서비스 모드: 인덱스는 서비스 프로세스에 있으므로 서비스에 요청
+    if embedding_service_client is not None:
+        try:
+            return await embedding_service_client.reload(force)
+        except Exception as e:
+            return JSONResponse(status_code=502, content={"status": "failed", "error": str(e)})
+
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(None, reload_label_indexes, force)
+    status_code = {"not_ready": 503, "busy": 409, "rejected": 409, "failed": 500}.get(result["status"], 200)
+    return JSONResponse(status_code=status_code, content=result)
+
 @app.post("/classify-question")
 async def classify_question(question: str = Body(..., embed=True)):
-    category = predict_category(question)
-    return {"category": category}
+    # 카테고리와 의도를 함께 반환 (임베딩 1회)
+    return await classify(question)
 
 @app.post("/classify-intent")
 async def classify_intent(question: str = Body(..., embed=True)):
-    intent = predict_intent(question)
-    return {"intent": intent}
+    return await classify(question)
 
 @app.post("/chat")
 async def chat(prompt: str = Form(...), session_id: str = Form(...)):
@@ -290,9 +1218,14 @@ async def chat(prompt: str = Form(...), session_id: str = Form(...)):
         active_sessions[session_id] = []
 
     # 질문 분류 및 의도 분류 (예외 처리 포함)
+    category = intent = "알 수 없음"
     try:
-        category = predict_category(prompt)
-        intent = predict_intent(prompt)
+        labels = await classify(prompt)
+        # 신뢰도가 낮은 분류는 시스템 프롬프트에 반영하지 않음
+        if labels["category_confidence"] >= CLASSIFY_MIN_CONFIDENCE:
+            category = labels["category"]
+        if labels["intent_confidence"] >= CLASSIFY_MIN_CONFIDENCE:
+            intent = labels["intent"]
         print(f"[질문 분류] 입력: {prompt} → 카테고리: {category}, 의도: {intent}")
         
         classification_message = f"사용자의 질문은"
@@ -414,6 +1347,57 @@ async def chat_stream(session_id: str = Query(...)):
     return EventSourceResponse(event_generator())
 
 
+def preload_models():
+    """
+    마스터 프로세스에서 모델/인덱스를 동기 로드하고 fork 전에 백그라운드 스레드 정리
+    """
+    # fork 후 토크나이저 스레드 풀 교착 방지
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    model_loader.start()
+    if not model_loader.wait():
+        print(f"preload 실패 - 워커에서 다시 로드합니다: {model_loader.error}")
+    if embedding_batcher is not None:
+        embedding_batcher.stop(wait=True)
+
+
+def after_fork(torch_threads=0):
+    """
+    fork 된 워커 초기화 - 스레드와 SQLite 연결은 fork 로 복사되지 않으므로 워커에서 새로 시작
+    """
+    global embedding_batcher, classification_executor, disk_embedding_cache, warmup_report
+    if torch_threads and torch is not None:
+        torch.set_num_threads(torch_threads)
+    # 마스터에서 단일 스레드로 둔 faiss OpenMP 스레드 수 복원
+    if "faiss" in sys.modules:
+        sys.modules["faiss"].omp_set_num_threads(torch_threads or os.cpu_count() or 1)
+    classification_executor = ThreadPoolExecutor(max_workers=CLASSIFY_WORKERS, thread_name_prefix="classify")
+    if bucketed_encoder is not None:
+        embedding_batcher = EmbeddingBatcher(
+            encode_batch,
+            max_batch_size=EMBED_BATCH_MAX_SIZE,
+            max_wait_ms=EMBED_BATCH_MAX_WAIT_MS,
+        ).start()
+    if bucketed_encoder is not None:
+        disk_embedding_cache = open_disk_embedding_cache()
+
+    # 마스터는 forward 를 실행하지 않았으므로 워커에서 워밍업 - 워커가 실제로 인코딩할 수 있는지도 여기서 확인
+    # (gunicorn post_fork 에서 호출되므로 워밍업이 끝난 뒤 요청을 받음)
+    if WARMUP_QUESTIONS > 0 and model_loader.ready and bucketed_encoder is not None:
+        try:
+            warmup_report = run_warmup(WARMUP_QUESTIONS, WARMUP_BATCH_SIZES)
+        except Exception as e:
+            warmup_report = {"error": str(e)}
+            print(f"워커 {os.getpid()} 워밍업 실패 (인코딩 불가): {e}")
+    print(f"워커 {os.getpid()} 시작 (모델 상태: {model_loader.state}, torch 스레드: {torch.get_num_threads() if torch is not None else '-'})")
+
+
+# 모델 로딩(preload) 전까지 모듈 import 에 걸린 시간 - 이 시점부터 UI/상태 API 응답 가능
+main_import_seconds = round(time.perf_counter() - _main_import_started, 3)
+
+if PRELOAD_MODELS:
+    preload_models()
+
+
 # 서버 시작 시 필요한 디렉토리 생성
 def setup_directories():
     Path("static").mkdir(exist_ok=True)
@@ -0,0 +1,6 @@
+import os
+
+# 서버(main.py), 인덱스 빌드, 모델 준비(prepare)/ONNX 변환, 벤치마크 스크립트가 같은 모델을 쓰도록 한 곳에서 관리
+DEFAULT_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "intfloat/multilingual-e5-large-instruct")
+# Hugging Face Hub 리비전 (커밋 해시/브랜치) - 비워 두면 기본 브랜치, 준비된 int8 모델은 준비 시 리비전과 같아야 사용
+DEFAULT_MODEL_REVISION = os.getenv("EMBEDDING_MODEL_REVISION", "")
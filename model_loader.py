@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+
+IDLE = "idle"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+
+class ModelLoader:
+    """
+    모델/인덱스 로딩 상태 머신 (idle → loading → ready / failed)
+
+    - start() 는 몇 번을 호출해도 로딩 스레드를 하나만 띄움 (failed 상태에서만 다시 시작 가능)
+    - retry() 는 실패 후 일정 시간이 지난 경우에만 다시 시작 (일시적인 로딩 실패 후 요청이 들어오면 복구)
+    - 로딩 함수는 component() 로 단계를 감싸 단계별 진행 상태와 소요 시간을 기록
+    - wait() / wait_ready() 로 스레드나 이벤트 루프에서 준비 완료를 기다릴 수 있음
+    """
+
+    def __init__(self, load_fn, name="models"):
+        self.load_fn = load_fn
+        self.name = name
+        self.state = IDLE
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        self.components = {}
+
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._waiters = []  # (이벤트 루프, Future)
+        self._thread = None
+
+    @property
+    def ready(self) -> bool:
+        return self.state == READY
+
+    def start(self) -> bool:
+        """로딩 시작 - 이미 로딩 중이거나 완료되었으면 아무것도 하지 않고 False"""
+        with self._lock:
+            if self.state not in (IDLE, FAILED):
+                return False
+            self.state = LOADING
+            self.error = None
+            self.started_at = time.time()
+            self.finished_at = None
+            self.components = {}
+            self._done.clear()
+            self._thread = threading.Thread(target=self._run, name=f"{self.name}-loader", daemon=True)
+            self._thread.start()
+        return True
+
+    def retry(self, backoff=30.0) -> bool:
+        """
+        failed 상태이고 마지막 실패 후 backoff 초가 지났으면 로딩 다시 시작 (요청 경로에서 호출해도 되는 가벼운 확인)
+        """
+        if self.state != FAILED or (self.finished_at and time.time() - self.finished_at < backoff):
+            return False
+        error = self.error
+        if self.start():
+            print(f"{self.name} 로딩 재시도 (이전 오류: {error})")
+            return True
+        return False
+
+    def _run(self):
+        try:
+            self.load_fn(self)
+            self._finish(READY)
+        except Exception as e:
+            print(f"{self.name} 로딩 실패: {e}")
+            self._finish(FAILED, str(e))
+
+    def _finish(self, state, error=None):
+        with self._lock:
+            self.state = state
+            self.error = error
+            self.finished_at = time.time()
+            waiters, self._waiters = self._waiters, []
+            self._done.set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, future, state == READY)
+            except RuntimeError:
+                # 대기하던 이벤트 루프가 이미 종료됨
+                pass
+
+    @contextmanager
+    def component(self, name: str):
+        """
+        로딩 단계 기록 - 블록에서 예외가 나면 해당 단계를 failed 로 남기고 예외를 그대로 전달
+
+        블록 안에서 yield 된 dict 에 detail/state 를 넣어 결과를 보충할 수 있음
+        """
+        step = {"state": LOADING, "started_at": time.time(), "seconds": None}
+        with self._lock:
+            self.components[name] = step
+        try:
+            yield step
+        except Exception as e:
+            step["state"] = FAILED
+            step["error"] = str(e)
+            raise
+        else:
+            if step["state"] == LOADING:
+                step["state"] = READY
+        finally:
+            step["seconds"] = round(time.time() - step["started_at"], 3)
+
+    def wait(self, timeout=None) -> bool:
+        """로딩이 끝날 때까지 대기 (스레드용), 준비되었으면 True"""
+        self._done.wait(timeout)
+        return self.ready
+
+    async def wait_ready(self, timeout=None) -> bool:
+        """
+        로딩이 끝날 때까지 이벤트 루프를 막지 않고 대기, timeout 안에 준비되지 않으면 False
+        """
+        with self._lock:
+            if self.state in (READY, FAILED):
+                return self.ready
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._waiters.append((loop, future))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            return False
+
+    def status(self) -> dict:
+        with self._lock:
+            end = self.finished_at or time.time()
+            return {
+                "state": self.state,
+                "error": self.error,
+                "seconds": round(end - self.started_at, 3) if self.started_at else None,
+                "components": {
+                    name: {k: v for k, v in step.items() if k != "started_at"}
+                    for name, step in self.components.items()
+                },
+            }
+
+
+def _resolve(future, value):
+    if not future.done():
+        future.set_result(value)
@@ -0,0 +1,181 @@
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+DEFAULT_N_FEATURES = 1 << 18
+DEFAULT_NGRAM_RANGE = (1, 3)
+DEFAULT_MARGINS = (0.0, 0.05, 0.1, 0.15, 0.2, 0.3)
+
+
+class NgramClassifier:
+    """
+    문자 n-gram 해싱 특징 + 선형 분류기 - e5 인코더 앞단의 저비용 1차 분류기
+
+    - 정규화한 질문을 문자 n-gram 으로 나누고 crc32 해시로 고정 크기 특징 공간에 매핑 (tf-idf, L2 정규화)
+    - 레이블별 가중치는 학습 샘플 벡터의 정규화된 평균(centroid), 점수는 코사인 유사도
+    - 가중치는 특징 기준 희소 행렬(CSR)로 보관하여 질문에 나온 n-gram 만 조회
+    """
+
+    def __init__(self, n_features=DEFAULT_N_FEATURES, ngram_range=DEFAULT_NGRAM_RANGE):
+        self.n_features = int(n_features)
+        self.ngram_range = (int(ngram_range[0]), int(ngram_range[1]))
+        self.labels = np.array([], dtype=str)
+        self.idf = None
+        self.indptr = np.zeros(self.n_features + 1, dtype=np.int32)
+        self.classes = np.array([], dtype=np.int32)
+        self.weights = np.array([], dtype=np.float32)
+
+    def term_counts(self, text: str):
+        """해시된 n-gram 인덱스와 빈도"""
+        text = f" {normalize_text(text).lower()} "
+        counts = Counter()
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                gram = text[i:i + n]
+                if gram.isspace():
+                    continue
+                counts[zlib.crc32(gram.encode("utf-8")) % self.n_features] += 1
+        idx = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+        return idx, tf
+
+    def features(self, text: str):
+        """tf-idf 가중 후 L2 정규화한 희소 벡터 (인덱스, 값)"""
+        idx, tf = self.term_counts(text)
+        values = 1.0 + np.log(tf)
+        if self.idf is not None and len(idx):
+            values *= self.idf[idx]
+        norm = float(np.linalg.norm(values))
+        if norm > 0:
+            values /= norm
+        return idx, values.astype(np.float32)
+
+    def fit(self, sentences, labels):
+        names = list(dict.fromkeys(labels))
+        class_of = {name: i for i, name in enumerate(names)}
+        counts = [self.term_counts(s) for s in sentences]
+
+        # 문서 빈도 기반 idf (smooth)
+        df = np.zeros(self.n_features, dtype=np.float32)
+        for idx, _ in counts:
+            df[idx] += 1
+        self.idf = (np.log((1.0 + len(sentences)) / (1.0 + df)) + 1.0).astype(np.float32)
+
+        # 레이블별 centroid 누적
+        centroids = [Counter() for _ in names]
+        for sentence, label in zip(sentences, labels):
+            idx, values = self.features(sentence)
+            centroid = centroids[class_of[label]]
+            for feature, value in zip(idx.tolist(), values.tolist()):
+                centroid[feature] += value
+
+        features, classes, weights = [], [], []
+        for c, centroid in enumerate(centroids):
+            if not centroid:
+                continue
+            values = np.fromiter(centroid.values(), dtype=np.float32, count=len(centroid))
+            values /= max(float(np.linalg.norm(values)), 1e-12)
+            features.extend(centroid.keys())
+            classes.extend([c] * len(centroid))
+            weights.append(values)
+
+        features = np.array(features, dtype=np.int64)
+        order = np.argsort(features, kind="stable")
+        self.labels = np.array(names, dtype=str)
+        self.classes = np.array(classes, dtype=np.int32)[order]
+        self.weights = np.concatenate(weights)[order] if weights else np.array([], dtype=np.float32)
+        self.indptr = np.zeros(self.n_features + 1, dtype=np.int32)
+        self.indptr[1:] = np.cumsum(np.bincount(features, minlength=self.n_features))
+        return self
+
+    def scores(self, text: str) -> np.ndarray:
+        """레이블별 코사인 점수"""
+        idx, values = self.features(text)
+        if not len(idx):
+            return np.zeros(len(self.labels), dtype=np.float32)
+        starts = self.indptr[idx]
+        lengths = self.indptr[idx + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.zeros(len(self.labels), dtype=np.float32)
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(total)
+        return np.bincount(
+            self.classes[offsets],
+            weights=self.weights[offsets] * np.repeat(values, lengths),
+            minlength=len(self.labels),
+        ).astype(np.float32)
+
+    def predict(self, text: str, temperature=0.05, runner_ups=2) -> dict:
+        """
+        최고 점수 레이블과 1, 2위 점수 차(margin), 점수 softmax 기반 신뢰도 반환
+        """
+        scores = self.scores(text)
+        if not len(scores) or float(scores.max()) <= 0.0:
+            return {"label": None, "score": 0.0, "margin": 0.0, "confidence": 0.0, "runner_up": []}
+
+        top = np.argsort(-scores)[:runner_ups + 1]
+        weights = np.exp((scores[top] - scores[top[0]]) / max(temperature, 1e-6))
+        probs = weights / weights.sum()
+        second = float(scores[top[1]]) if len(top) > 1 else 0.0
+        return {
+            "label": str(self.labels[top[0]]),
+            "score": float(scores[top[0]]),
+            "margin": float(scores[top[0]]) - second,
+            "confidence": round(float(probs[0]), 4),
+            "runner_up": [
+                {"label": str(self.labels[c]), "score": round(float(p), 4)}
+                for c, p in zip(top[1:], probs[1:])
+            ],
+        }
+
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.idf, self.indptr, self.classes, self.weights) if a is not None)
+
+    def save(self, path: str):
+        np.savez(
+            path,
+            labels=self.labels,
+            idf=self.idf,
+            indptr=self.indptr,
+            classes=self.classes,
+            weights=self.weights,
+            config=np.array([self.n_features, *self.ngram_range], dtype=np.int64),
+        )
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            n_features, low, high = (int(v) for v in data["config"])
+            model = cls(n_features, (low, high))
+            model.labels = data["labels"]
+            model.idf = data["idf"]
+            model.indptr = data["indptr"]
+            model.classes = data["classes"]
+            model.weights = data["weights"]
+        return model
+
+
+def accepts(prediction: dict, min_margin: float, min_score=0.0) -> bool:
+    """서버와 같은 조건으로 1차 분류기 결과를 바로 사용할지 (margin, 최고 점수 하한)"""
+    return (prediction["label"] is not None and prediction["margin"] >= min_margin
+            and prediction["score"] >= min_score)
+
+
+def margin_sweep(model, sentences, labels, margins, min_score=0.0):
+    """
+    margin 임계값별 1차 분류기 처리 비율과 정확도 - 임계값 선택용 (최고 점수 하한 min_score 도 함께 적용)
+    """
+    predictions = [model.predict(s) for s in sentences]
+    rows = []
+    for threshold in margins:
+        accepted = [(p["label"], label) for p, label in zip(predictions, labels)
+                    if accepts(p, threshold, min_score)]
+        coverage = len(accepted) / len(labels) if len(labels) else 0.0
+        accuracy = sum(p == e for p, e in accepted) / len(accepted) if accepted else 0.0
+        rows.append({"margin": threshold, "coverage": coverage, "accuracy": accuracy})
+    return rows, predictions
+
@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from model_config import DEFAULT_MODEL_NAME
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+MANIFEST_FILE = "onnx_manifest.json"
+
+
+def default_onnx_dir(model_name: str, cache_dir: str) -> str:
+    """model_cache/onnx/<모델 이름> 경로"""
+    return os.path.join(cache_dir, "onnx", model_name.replace("/", "__"))
+
+
+def export_onnx(model_name: str, output_dir: str, quantize=True, opset=17, max_seq_length=None):
+    """
+    SentenceTransformer 모델을 평균 풀링 + L2 정규화까지 포함한 하나의 ONNX 그래프로 변환
+
+    - 출력 임베딩은 SentenceTransformer.encode() 결과와 같으므로 기존 인덱스를 그대로 사용 가능
+    - quantize=True 이면 int8 동적 양자화 버전(model.int8.onnx)도 함께 생성
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    st_model = SentenceTransformer(model_name, device="cpu")
+    st_model.eval()
+
+    # 인덱스와 같은 임베딩을 만들기 위해 풀링 방식 확인 (e5 계열은 mean 풀링 + 정규화)
+    pooling = st_model[1]
+    if not getattr(pooling, "pooling_mode_mean_tokens", False):
+        raise ValueError(f"mean 풀링 모델만 지원합니다: {model_name}")
+    normalize = any(type(module).__name__ == "Normalize" for module in st_model)
+
+    transformer = st_model[0].auto_model
+    tokenizer = st_model.tokenizer
+    max_seq_length = max_seq_length or st_model.max_seq_length
+
+    class PooledEncoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            token_embeddings = self.model(input_ids=input_ids, attention_mask=attention_mask)[0]
+            mask = attention_mask.unsqueeze(-1).to(token_embeddings.dtype)
+            pooled = (token_embeddings * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            if normalize:
+                pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
+            return pooled
+
+    wrapper = PooledEncoder(transformer).eval()
+    dummy = tokenizer(["query: 안녕하세요", "passage: 샘플 문장입니다"], padding=True, return_tensors="pt")
+
+    fp32_path = os.path.join(output_dir, FP32_FILE)
+    print(f"ONNX 변환 중... ({model_name} → {fp32_path})")
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["sentence_embedding"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "sentence_embedding": {0: "batch"},
+            },
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(output_dir)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        int8_path = os.path.join(output_dir, INT8_FILE)
+        print(f"int8 동적 양자화 중... ({int8_path})")
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    manifest = {
+        "model_name": model_name,
+        "pooling": "mean",
+        "normalize": normalize,
+        "max_seq_length": int(max_seq_length),
+        "dim": int(st_model.get_sentence_embedding_dimension()),
+        "opset": opset,
+        "quantized": bool(quantize),
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    # 변환 결과가 원본 모델과 같은 임베딩을 내는지 확인
+    samples = ["프로그래밍이란 무엇인가요?", "이것에 대해 알려주세요", "SELECT * FROM users WHERE id = 1"]
+    expected = st_model.encode(samples, normalize_embeddings=False)
+    for quantized in ([False, True] if quantize else [False]):
+        encoder = OnnxEncoder(output_dir, quantized=quantized)
+        actual = encoder.encode(samples)
+        cosine = np.sum(actual * expected, axis=1) / (
+            np.linalg.norm(actual, axis=1) * np.linalg.norm(expected, axis=1)
+        )
+        print(f"[검증] {'int8' if quantized else 'fp32'}: 원본 대비 최소 코사인 유사도 {cosine.min():.5f}")
+    return manifest
+
+
+class OnnxEncoder:
+    """
+    onnxruntime 기반 e5 인코더 - SentenceTransformer.encode() 와 같은 형태로 사용
+    """
+
+    def __init__(self, model_dir: str, quantized=True, intra_op_threads=0, inter_op_threads=0, max_seq_length=None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(model_dir, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+
+        path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"ONNX 모델 파일이 없습니다: {path}")
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads:
+            options.intra_op_num_threads = int(intra_op_threads)
+        if inter_op_threads:
+            options.inter_op_num_threads = int(inter_op_threads)
+
+        self.model_path = path
+        self.quantized = quantized
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_seq_length = int(max_seq_length or self.manifest.get("max_seq_length", 512))
+        self.model_name = self.manifest.get("model_name")
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.manifest["dim"])
+
+    def forward(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """토큰화된 입력으로 바로 임베딩 계산 (길이 버킷 인코더에서 사용)"""
+        return self.session.run(None, {
+            "input_ids": input_ids.astype(np.int64, copy=False),
+            "attention_mask": attention_mask.astype(np.int64, copy=False),
+        })[0]
+
+    def encode(self, sentences, batch_size=32, show_progress_bar=False, **kwargs) -> np.ndarray:
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        outputs = []
+        for start in range(0, len(sentences), batch_size):
+            features = self.tokenizer(
+                list(sentences[start:start + batch_size]),
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            outputs.append(self.forward(features["input_ids"], features["attention_mask"]))
+        if not outputs:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.vstack(outputs).astype(np.float32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="e5 인코더 ONNX 변환")
+    parser.add_argument("--model", type=str, default=DEFAULT_MODEL_NAME, help="변환할 SentenceTransformer 모델 이름")
+    parser.add_argument("--output-dir", type=str, default=None, help="출력 경로 (기본: model_cache/onnx/<모델 이름>)")
+    parser.add_argument("--no-quantize", action="store_true", help="int8 양자화 버전을 만들지 않음")
+    parser.add_argument("--opset", type=int, default=17, help="ONNX opset 버전")
+    args = parser.parse_args()
+
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_cache")
+    output_dir = args.output_dir or default_onnx_dir(args.model, cache_dir)
+    started = time.time()
+    export_onnx(args.model, output_dir, quantize=not args.no_quantize, opset=args.opset)
+    print(f"ONNX 변환 완료: {output_dir} (소요 시간: {time.time() - started:.1f}초)")
@@ -0,0 +1,291 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from model_config import DEFAULT_MODEL_NAME, DEFAULT_MODEL_REVISION
+
+MANIFEST_FILE = "prepared_manifest.json"
+VERIFIED_FILE = "verified.json"  # 체크섬 검증을 마친 파일의 (크기, 수정 시각) - 다음 시작부터 전체 해시 생략
+INT8_FILE = "model.int8.pt"
+SAFETENSORS_FILE = "model.safetensors"
+FORMATS = ["int8", "fp16", "fp32"]
+
+
+def default_prepared_dir(model_name: str, cache_dir: str, fmt="int8") -> str:
+    """model_cache/prepared/<모델 이름>-<형식> 경로"""
+    return os.path.join(cache_dir, "prepared", f"{model_name.replace('/', '__')}-{fmt}")
+
+
+def quantize_sentence_transformer(model):
+    """
+    SentenceTransformer 내부 트랜스포머의 Linear 레이어를 int8 동적 양자화 (제자리 교체)
+    """
+    import torch
+    from torch.quantization import quantize_dynamic
+
+    quantized = 0
+    for module in model:
+        auto_model = getattr(module, "auto_model", None)
+        if auto_model is not None:
+            module.auto_model = quantize_dynamic(auto_model, {torch.nn.Linear}, dtype=torch.qint8)
+            quantized += 1
+    if not quantized:
+        raise ValueError("양자화할 트랜스포머 모듈이 없습니다")
+    return model
+
+
+def file_sha256(path: str, chunk_size=8 * 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def library_versions() -> dict:
+    import sentence_transformers
+    import torch
+    import transformers
+
+    return {
+        "torch": torch.__version__,
+        "transformers": transformers.__version__,
+        "sentence_transformers": sentence_transformers.__version__,
+    }
+
+
+def cached_model_revision(model_name: str, revision=None):
+    """
+    Hugging Face 캐시에 받아 둔 모델의 커밋 해시 (snapshots/<sha>)
+    - 로컬 경로 모델이거나 캐시에 없으면 None
+    """
+    if os.path.isdir(model_name):
+        return None
+    try:
+        from huggingface_hub import try_to_load_from_cache
+
+        path = try_to_load_from_cache(model_name, "config.json", revision=revision or None)
+    except Exception:
+        return None
+    if not isinstance(path, str):
+        return None
+    return os.path.basename(os.path.dirname(path))
+
+
+def loaded_model_revision(model, model_name: str, revision=None):
+    """로드한 SentenceTransformer 의 커밋 해시 (transformers 가 config 에 기록), 없으면 캐시에서 확인"""
+    try:
+        commit = model[0].auto_model.config._commit_hash
+    except (AttributeError, IndexError, KeyError, TypeError):
+        commit = None
+    return commit or cached_model_revision(model_name, revision)
+
+
+def prepare_model(model_name: str, output_dir: str, fmt="int8", revision=None):
+    """
+    서버가 바로 읽을 수 있는 모델 파일 생성 (한 번만 실행)
+
+    - int8: 동적 양자화까지 끝낸 모듈을 저장 → 서버는 fp32 가중치 로드/양자화 없이 바로 사용 (CPU)
+    - fp16/fp32: safetensors 로 저장 → 로컬 경로에서 mmap 으로 로드 (GPU 또는 양자화하지 않는 경우)
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if fmt not in FORMATS:
+        raise ValueError(f"지원하지 않는 형식: {fmt}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    model = SentenceTransformer(model_name, device="cpu", revision=revision or None)
+    model.eval()
+    model_revision = loaded_model_revision(model, model_name, revision)
+    if fmt == "int8":
+        quantize_sentence_transformer(model)
+        artifact = os.path.join(output_dir, INT8_FILE)
+        torch.save(model, artifact)
+    else:
+        if fmt == "fp16":
+            model.half()
+        model.save(output_dir, safe_serialization=True)
+        artifact = os.path.join(output_dir, SAFETENSORS_FILE)
+        if not os.path.exists(artifact):
+            # 모델 구조에 따라 0_Transformer/ 아래에 저장됨
+            candidates = [os.path.join(root, SAFETENSORS_FILE) for root, _, files in os.walk(output_dir)
+                          if SAFETENSORS_FILE in files]
+            if not candidates:
+                raise FileNotFoundError(f"safetensors 파일이 생성되지 않았습니다: {output_dir}")
+            artifact = candidates[0]
+
+    manifest = {
+        "model_name": model_name,
+        "revision": model_revision,
+        "format": fmt,
+        "file": os.path.relpath(artifact, output_dir),
+        "sha256": file_sha256(artifact),
+        "size": os.path.getsize(artifact),
+        "dim": int(model.get_sentence_embedding_dimension()),
+        "max_seq_length": int(model.max_seq_length),
+        "versions": library_versions(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def verify_artifact(model_dir: str, artifact: str, sha256: str) -> bool:
+    """
+    모델 파일 sha256 검증 - 전체 해시는 처음 한 번만 계산하고, 이후에는 검증 당시 기록한
+    (크기, 수정 시각)이 그대로이면 생략 (수 GB 파일을 매 시작마다 읽지 않도록)
+    """
+    stat = os.stat(artifact)
+    stamp = {"file": os.path.basename(artifact), "sha256": sha256, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    stamp_path = os.path.join(model_dir, VERIFIED_FILE)
+    try:
+        with open(stamp_path, "r", encoding="utf-8") as f:
+            if json.load(f) == stamp:
+                return True
+    except (OSError, ValueError):
+        pass
+
+    if file_sha256(artifact) != sha256:
+        return False
+    try:
+        with open(stamp_path, "w", encoding="utf-8") as f:
+            json.dump(stamp, f)
+    except OSError as e:
+        # 읽기 전용 경로 - 다음 시작에서도 전체 해시 계산
+        print(f"검증 기록 저장 실패 (무시됨): {e}")
+    return True
+
+
+def read_manifest(model_dir: str):
+    path = os.path.join(model_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_prepared_model(model_dir: str, model_name: str, device="cpu", verify=True, revision=None):
+    """
+    prepare 단계에서 만든 모델 로드 - 모델 이름/리비전/라이브러리 버전/체크섬이 맞지 않으면 ValueError
+
+    - revision: 사용할 Hub 리비전 (커밋 해시 앞부분 가능), 없으면 HF 캐시에 받아 둔 리비전과 비교 (캐시에도 없으면 생략)
+
+    반환: (SentenceTransformer, manifest)
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    manifest = read_manifest(model_dir)
+    if manifest is None:
+        raise FileNotFoundError(f"준비된 모델이 없습니다: {model_dir}")
+    if manifest.get("model_name") != model_name:
+        raise ValueError(f"준비된 모델({manifest.get('model_name')})이 설정된 모델({model_name})과 다릅니다")
+    expected = revision or cached_model_revision(model_name)
+    saved = manifest.get("revision") or ""
+    if expected and not saved.startswith(expected):
+        raise ValueError(f"준비된 모델 리비전({saved or '기록 없음'})이 현재 리비전({expected})과 다릅니다 - prepare 를 다시 실행하세요")
+
+    artifact = os.path.join(model_dir, manifest["file"])
+    if not os.path.exists(artifact):
+        raise FileNotFoundError(f"모델 파일이 없습니다: {artifact}")
+    if os.path.getsize(artifact) != manifest.get("size"):
+        raise ValueError(f"모델 파일 크기가 manifest 와 다릅니다: {artifact}")
+    if verify and not verify_artifact(model_dir, artifact, manifest.get("sha256")):
+        raise ValueError(f"모델 파일 체크섬이 manifest 와 다릅니다: {artifact}")
+
+    if manifest["format"] == "int8":
+        # 양자화 모듈은 pickle 로 저장되므로 (모듈 클래스 정의가 같은) 같은 라이브러리 버전에서만 사용
+        # torch 는 major.minor, transformers/sentence_transformers 는 정확히 같은 버전
+        versions = manifest.get("versions", {})
+        current = library_versions()
+        if versions.get("torch", "").split(".")[:2] != current["torch"].split(".")[:2]:
+            raise ValueError(f"torch 버전이 다릅니다 (준비: {versions.get('torch')}, 현재: {current['torch']}) "
+                             f"- prepare 를 다시 실행하세요")
+        for name in ("transformers", "sentence_transformers"):
+            if versions.get(name) != current[name]:
+                raise ValueError(f"{name} 버전이 다릅니다 (준비: {versions.get(name) or '기록 없음'}, 현재: {current[name]}) "
+                                 f"- prepare 를 다시 실행하세요")
+        try:
+            model = torch.load(artifact, map_location="cpu", weights_only=False, mmap=True)
+        except TypeError:
+            # mmap/weights_only 를 지원하지 않는 이전 torch
+            model = torch.load(artifact, map_location="cpu")
+    else:
+        # 로컬 safetensors 는 mmap 으로 읽고, 저장된 dtype 그대로 사용하여 fp32 사본을 만들지 않음
+        try:
+            model = SentenceTransformer(model_dir, device=device, model_kwargs={"torch_dtype": "auto"})
+        except TypeError:
+            model = SentenceTransformer(model_dir, device=device)
+    model.eval()
+    return model, manifest
+
+
+def measure_child(args):
+    """단일 로드 방식의 시작 시간/최대 RSS 측정 (자식 프로세스)"""
+    from process_memory import read_rss_mb
+
+    started = time.perf_counter()
+    if args.measure == "runtime":
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(args.model, device="cpu", revision=args.revision or None)
+        if args.format == "int8":
+            quantize_sentence_transformer(model)
+    else:
+        model, _ = load_prepared_model(args.output_dir, args.model, verify=not args.no_verify, revision=args.revision)
+    load_seconds = time.perf_counter() - started
+    model.encode(["query: 워밍업"], show_progress_bar=False)
+    rss, peak = read_rss_mb()
+    print(json.dumps({"mode": args.measure, "load_seconds": round(load_seconds, 2),
+                      "rss_mb": round(rss, 1), "peak_rss_mb": round(peak, 1)}))
+
+
+def compare_startup(args):
+    """실행 시 양자화 vs 준비된 모델의 로드 시간과 최대 RSS 비교"""
+    print(f"\n{'mode':<10}{'load(s)':>10}{'RSS(MB)':>10}{'peak(MB)':>10}")
+    for mode in ("runtime", "prepared"):
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", mode, "--model", args.model,
+               "--format", args.format, "--output-dir", args.output_dir, "--revision", args.revision]
+        if args.no_verify:
+            cmd.append("--no-verify")
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"[{mode}] 실패:\n{proc.stderr.strip()[-2000:]}")
+            continue
+        row = json.loads(proc.stdout.strip().splitlines()[-1])
+        print(f"{row['mode']:<10}{row['load_seconds']:>10}{row['rss_mb']:>10}{row['peak_rss_mb']:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="서버 시작용 모델 파일 준비 (양자화 / safetensors)")
+    parser.add_argument("--model", type=str, default=DEFAULT_MODEL_NAME, help="준비할 SentenceTransformer 모델 이름")
+    parser.add_argument("--revision", type=str, default=DEFAULT_MODEL_REVISION,
+                        help="Hugging Face Hub 리비전 (커밋 해시/브랜치, 기본: EMBEDDING_MODEL_REVISION 또는 기본 브랜치)")
+    parser.add_argument("--format", type=str, choices=FORMATS, default="int8",
+                        help="int8: CPU 동적 양자화 모듈, fp16/fp32: safetensors (mmap 로드)")
+    parser.add_argument("--output-dir", type=str, default=None,
+                        help="출력 경로 (기본: model_cache/prepared/<모델 이름>-<형식>)")
+    parser.add_argument("--compare", action="store_true", help="준비 후 실행 시 양자화 대비 로드 시간/RSS 비교")
+    parser.add_argument("--no-verify", action="store_true", help="로드 시 체크섬 검증 생략")
+    parser.add_argument("--child", type=str, choices=["runtime", "prepared"], dest="measure", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_cache")
+    args.output_dir = args.output_dir or default_prepared_dir(args.model, cache_dir, args.format)
+
+    if args.measure:
+        measure_child(args)
+    else:
+        started = time.time()
+        manifest = prepare_model(args.model, args.output_dir, args.format, args.revision)
+        print(f"모델 준비 완료: {args.output_dir} ({manifest['format']}, {manifest['size'] / 1024 / 1024:.1f}MB, "
+              f"소요 시간: {time.time() - started:.1f}초)")
+        if args.compare:
+            compare_startup(args)
@@ -0,0 +1,108 @@
+import argparse
+import os
+import time
+
+# smaps_rollup 항목 → 보고 이름
+SMAPS_FIELDS = {
+    "Rss": "rss",
+    "Pss": "pss",
+    "Shared_Clean": "shared_clean",
+    "Shared_Dirty": "shared_dirty",
+    "Private_Clean": "private_clean",
+    "Private_Dirty": "private_dirty",
+}
+
+
+def read_memory_mb(pid="self") -> dict:
+    """
+    프로세스 메모리 (MB) - /proc/<pid>/smaps_rollup 기반 (Linux)
+
+    - rss: 공유 페이지 포함 전체 / pss: 공유 페이지를 공유 프로세스 수로 나눈 값
+    - uss: 이 프로세스만 가진 페이지 (fork 된 워커가 실제로 추가로 쓰는 메모리)
+    """
+    values = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in SMAPS_FIELDS:
+                    values[SMAPS_FIELDS[key]] = int(rest.split()[0]) / 1024.0
+    except OSError:
+        # smaps_rollup 을 지원하지 않는 커널 - RSS 만 보고
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        values["rss"] = int(line.split()[1]) / 1024.0
+        except OSError:
+            return {}
+    if "private_clean" in values:
+        values["uss"] = values["private_clean"] + values["private_dirty"]
+        values["shared"] = values["shared_clean"] + values["shared_dirty"]
+    return {key: round(value, 1) for key, value in values.items()}
+
+
+def read_rss_mb():
+    """현재/최대 RSS (MB) - /proc/self/status 기반 (Linux), 벤치마크/시작 시간 측정용"""
+    values = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, value = line.split(":", 1)
+                    values[key] = int(value.split()[0]) / 1024.0
+    except OSError:
+        pass
+    return values.get("VmRSS", 0.0), values.get("VmHWM", 0.0)
+
+
+def child_pids(pid: int):
+    """직계 자식 프로세스 pid 목록"""
+    children = []
+    try:
+        for name in os.listdir(f"/proc/{pid}/task"):
+            with open(f"/proc/{pid}/task/{name}/children") as f:
+                children.extend(int(p) for p in f.read().split())
+        return sorted(children)
+    except OSError:
+        pass
+    # /proc/<pid>/task/*/children 이 없는 커널 - 전체 프로세스의 부모 pid 확인
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[1]) == pid:
+                children.append(int(name))
+        except (OSError, IndexError, ValueError):
+            continue
+    return sorted(children)
+
+
+def report(master_pid: int) -> list:
+    rows = [("master", master_pid, read_memory_mb(master_pid))]
+    rows += [("worker", pid, read_memory_mb(pid)) for pid in child_pids(master_pid)]
+
+    print(f"{'role':<8}{'pid':>8}{'RSS(MB)':>10}{'PSS(MB)':>10}{'USS(MB)':>10}{'shared(MB)':>12}")
+    for role, pid, mem in rows:
+        print(f"{role:<8}{pid:>8}{mem.get('rss', 0):>10}{mem.get('pss', 0):>10}"
+              f"{mem.get('uss', 0):>10}{mem.get('shared', 0):>12}")
+    total_rss = sum(mem.get("rss", 0) for _, _, mem in rows)
+    total_pss = sum(mem.get("pss", 0) for _, _, mem in rows)
+    print(f"합계: RSS {total_rss:.1f}MB (공유 페이지 중복 계산), PSS {total_pss:.1f}MB (실제 사용량)")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="마스터/워커 프로세스별 RSS, PSS, USS (copy-on-write 공유 확인)")
+    parser.add_argument("pid", type=int, help="gunicorn 마스터 pid")
+    parser.add_argument("--interval", type=float, default=0, help="반복 출력 간격(초), 0이면 한 번만")
+    args = parser.parse_args()
+
+    while True:
+        report(args.pid)
+        if args.interval <= 0:
+            break
+        print()
+        time.sleep(args.interval)